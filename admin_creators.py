@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Request, Form, Depends, status
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
 import bcrypt
 import random
 import string
@@ -8,7 +8,6 @@ import string
 from guards import admin_guard_ui  # общий guard, читает куку admin_auth
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 
 # Обёртка для Depends: берём актуальный токен из app.state
 def guard(request: Request):
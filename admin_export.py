@@ -0,0 +1,127 @@
+# admin_export.py
+# Выгрузка users / purchases / user_groups для админов (CSV или NDJSON) потоком
+# через серверный курсор — память не растёт с количеством строк.
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Request, Depends
+
+from guards import admin_guard_ui
+from streaming import stream_query
+import user_search
+
+router = APIRouter(prefix="/admin/export", tags=["Admin Export"])
+
+
+def _day_start(d: date) -> datetime:
+    return datetime.combine(d, datetime.min.time())
+
+
+def _date_range(where: list, args: list, column: str, date_from: Optional[date], date_to: Optional[date]):
+    if date_from:
+        args.append(_day_start(date_from))
+        where.append(f"{column} >= ${len(args)}")
+    if date_to:
+        args.append(_day_start(date_to + timedelta(days=1)))
+        where.append(f"{column} < ${len(args)}")
+
+
+def _where_sql(where: list) -> str:
+    return f"WHERE {' AND '.join(where)}" if where else ""
+
+
+@router.get("/users")
+async def export_users(
+    request: Request,
+    q: Optional[str] = None,
+    format: Literal["csv", "ndjson"] = "csv",
+    _=Depends(admin_guard_ui)
+):
+    """Пользователи; q — тот же поиск, что и в /admin/users."""
+    where, args = [], []
+    if q:
+        search_sql, search_args = user_search.build_user_filter(q, 1)
+        where.append(search_sql)
+        args.extend(search_args)
+
+    return stream_query(
+        request.app.state.pool,
+        f"""
+        SELECT u.id, u.uid, u.email, u.username, u.email_confirmed, u.created_at, u.last_login
+        FROM users u
+        {_where_sql(where)}
+        ORDER BY u.created_at DESC, u.id DESC
+        """,
+        tuple(args),
+        format,
+        "users",
+    )
+
+
+@router.get("/purchases")
+async def export_purchases(
+    request: Request,
+    user_uid: Optional[str] = None,
+    source: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    format: Literal["csv", "ndjson"] = "csv",
+    _=Depends(admin_guard_ui)
+):
+    where, args = [], []
+    if user_uid:
+        try:
+            args.append(uuid.UUID(user_uid.strip()))
+            where.append(f"p.user_uid = ${len(args)}")
+        except ValueError:
+            # Невалидный UID — пустая выгрузка, а не 500
+            where.append("FALSE")
+    if source:
+        args.append(source)
+        where.append(f"p.source = ${len(args)}")
+    _date_range(where, args, "p.created_at", date_from, date_to)
+
+    return stream_query(
+        request.app.state.pool,
+        f"""
+        SELECT p.id, p.user_uid, p.plan, p.amount, p.currency, p.source, p.token_code, p.created_at
+        FROM purchases p
+        {_where_sql(where)}
+        ORDER BY p.id
+        """,
+        tuple(args),
+        format,
+        "purchases",
+    )
+
+
+@router.get("/user_groups")
+async def export_user_groups(
+    request: Request,
+    group_id: Optional[int] = None,
+    active_only: bool = False,
+    format: Literal["csv", "ndjson"] = "csv",
+    _=Depends(admin_guard_ui)
+):
+    where, args = [], []
+    if group_id:
+        args.append(group_id)
+        where.append(f"ug.group_id = ${len(args)}")
+    if active_only:
+        where.append("ug.is_active = TRUE AND ug.expires_at > NOW()")
+
+    return stream_query(
+        request.app.state.pool,
+        f"""
+        SELECT ug.id, ug.user_uid, u.email, g.slug AS group_slug, ug.granted_at, ug.expires_at, ug.is_active
+        FROM user_groups ug
+        JOIN groups g ON g.id = ug.group_id
+        LEFT JOIN users u ON u.uid = ug.user_uid
+        {_where_sql(where)}
+        ORDER BY ug.id
+        """,
+        tuple(args),
+        format,
+        "user_groups",
+    )
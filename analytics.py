@@ -0,0 +1,180 @@
+# analytics.py
+# Дневные сводки (выручка, регистрации, активации ключей, активные подписки).
+# Фоновая задача досчитывает только новые строки purchases/users (водяной знак по id),
+# страница /admin/analytics читает готовые сводки и не зависит от размера purchases.
+import os
+import asyncio
+from datetime import date, timedelta
+
+from fastapi import APIRouter, Request, Depends
+from fastapi.responses import HTMLResponse, RedirectResponse
+
+from guards import admin_guard_ui
+from templating import templates
+
+router = APIRouter(prefix="/admin/analytics", tags=["Admin Analytics"])
+
+ROLLUP_INTERVAL_SECONDS = int(os.getenv("ROLLUP_INTERVAL_SECONDS", "300"))
+# Строки моложе этого не берём: транзакция с меньшим id может ещё не закоммититься
+ROLLUP_SETTLE_SECONDS = int(os.getenv("ROLLUP_SETTLE_SECONDS", "60"))
+ANALYTICS_DAYS = 30
+
+
+async def _advance(conn, name: str, table: str) -> tuple:
+    """
+    Берёт водяной знак (с блокировкой — несколько воркеров gunicorn не посчитают дважды)
+    и новую верхнюю границу id. Возвращает (from_id, to_id).
+    """
+    await conn.execute(
+        "INSERT INTO analytics_watermarks (name, last_id) VALUES ($1, 0) ON CONFLICT (name) DO NOTHING", name
+    )
+    last_id = await conn.fetchval("SELECT last_id FROM analytics_watermarks WHERE name = $1 FOR UPDATE", name)
+    upper = await conn.fetchval(f"""
+        SELECT COALESCE(MAX(id), $1) FROM {table}
+        WHERE id > $1 AND created_at < NOW() - make_interval(secs => $2)
+    """, last_id, ROLLUP_SETTLE_SECONDS)
+    return last_id, upper
+
+
+async def rollup_purchases(conn) -> int:
+    from_id, to_id = await _advance(conn, "purchases", "purchases")
+    if to_id <= from_id:
+        return 0
+
+    await conn.execute("""
+        INSERT INTO analytics_daily_revenue AS t (day, plan, source, currency, purchases, amount)
+        SELECT created_at::date, COALESCE(plan, ''), COALESCE(source, ''), COALESCE(currency, ''),
+               COUNT(*), COALESCE(SUM(amount), 0)
+        FROM purchases
+        WHERE id > $1 AND id <= $2
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (day, plan, source, currency) DO UPDATE
+        SET purchases = t.purchases + EXCLUDED.purchases,
+            amount = t.amount + EXCLUDED.amount
+    """, from_id, to_id)
+
+    await conn.execute("""
+        INSERT INTO analytics_daily_activations AS t (day, activations)
+        SELECT created_at::date, COUNT(*)
+        FROM purchases
+        WHERE id > $1 AND id <= $2 AND source = 'key_activation'
+        GROUP BY 1
+        ON CONFLICT (day) DO UPDATE SET activations = t.activations + EXCLUDED.activations
+    """, from_id, to_id)
+
+    await conn.execute("UPDATE analytics_watermarks SET last_id = $1 WHERE name = 'purchases'", to_id)
+    return to_id - from_id
+
+
+async def rollup_signups(conn) -> int:
+    from_id, to_id = await _advance(conn, "users", "users")
+    if to_id <= from_id:
+        return 0
+
+    await conn.execute("""
+        INSERT INTO analytics_daily_signups AS t (day, users)
+        SELECT created_at::date, COUNT(*)
+        FROM users
+        WHERE id > $1 AND id <= $2
+        GROUP BY 1
+        ON CONFLICT (day) DO UPDATE SET users = t.users + EXCLUDED.users
+    """, from_id, to_id)
+
+    await conn.execute("UPDATE analytics_watermarks SET last_id = $1 WHERE name = 'users'", to_id)
+    return to_id - from_id
+
+
+async def snapshot_active_subs(conn):
+    """Снимок активных подписок по группам на сегодня (перезаписывается каждый проход)."""
+    # Группа, у которой не осталось активных, должна показать 0, а не прошлое значение
+    await conn.execute("DELETE FROM analytics_daily_active_subs WHERE day = CURRENT_DATE")
+    await conn.execute("""
+        INSERT INTO analytics_daily_active_subs AS t (day, group_id, active)
+        SELECT CURRENT_DATE, group_id, COUNT(*)
+        FROM user_groups
+        WHERE is_active = TRUE AND expires_at > NOW()
+        GROUP BY group_id
+        ON CONFLICT (day, group_id) DO UPDATE SET active = EXCLUDED.active
+    """)
+
+
+async def run_rollups(pool) -> dict:
+    report = {}
+    async with pool.acquire() as conn:
+        # Каждая сводка — своя транзакция вместе со своим водяным знаком
+        async with conn.transaction():
+            report["purchases"] = await rollup_purchases(conn)
+        async with conn.transaction():
+            report["users"] = await rollup_signups(conn)
+        async with conn.transaction():
+            await snapshot_active_subs(conn)
+    return report
+
+
+# --- WORKER ---
+async def worker(app):
+    await asyncio.sleep(20)
+    print(">>> [Analytics] WORKER STARTED", flush=True)
+    while True:
+        try:
+            if not hasattr(app.state, 'pool'): await asyncio.sleep(5); continue
+            await run_rollups(app.state.pool)
+        except Exception as e:
+            print(f"[Analytics] rollup error: {e}", flush=True)
+        await asyncio.sleep(ROLLUP_INTERVAL_SECONDS)
+
+
+# --- UI ---
+@router.get("", response_class=HTMLResponse)
+async def analytics_page(request: Request, _=Depends(admin_guard_ui)):
+    since = date.today() - timedelta(days=ANALYTICS_DAYS - 1)
+    async with request.app.state.pool.acquire() as conn:
+        daily = await conn.fetch("""
+            SELECT d.day::date AS day,
+                   COALESCE(r.revenue, 0) AS revenue,
+                   COALESCE(r.payments, 0) AS payments,
+                   COALESCE(s.users, 0) AS signups,
+                   COALESCE(a.activations, 0) AS activations
+            FROM generate_series($1::date, CURRENT_DATE, INTERVAL '1 day') AS d(day)
+            LEFT JOIN (
+                SELECT day, SUM(amount) AS revenue, SUM(purchases) AS payments
+                FROM analytics_daily_revenue
+                WHERE day >= $1 AND source = 'payment'
+                GROUP BY day
+            ) r ON r.day = d.day::date
+            LEFT JOIN analytics_daily_signups s ON s.day = d.day::date
+            LEFT JOIN analytics_daily_activations a ON a.day = d.day::date
+            ORDER BY d.day DESC
+        """, since)
+
+        by_plan = await conn.fetch("""
+            SELECT plan, source, SUM(purchases) AS purchases, SUM(amount) AS amount
+            FROM analytics_daily_revenue
+            WHERE day >= $1
+            GROUP BY plan, source
+            ORDER BY amount DESC, purchases DESC
+        """, since)
+
+        subs = await conn.fetch("""
+            SELECT g.name, g.slug, s.active
+            FROM analytics_daily_active_subs s
+            JOIN groups g ON g.id = s.group_id
+            WHERE s.day = (SELECT MAX(day) FROM analytics_daily_active_subs)
+            ORDER BY g.access_level DESC
+        """)
+
+    return templates.TemplateResponse("analytics.html", {
+        "request": request,
+        "daily": daily,
+        "by_plan": by_plan,
+        "subs": subs,
+        "days": ANALYTICS_DAYS,
+        "total_revenue": sum(r["revenue"] for r in daily),
+        "total_signups": sum(r["signups"] for r in daily),
+    })
+
+
+@router.post("/refresh")
+async def analytics_refresh(request: Request, _=Depends(admin_guard_ui)):
+    await run_rollups(request.app.state.pool)
+    return RedirectResponse("/admin/analytics", status_code=303)
@@ -0,0 +1,474 @@
+# artifacts.py
+# Кэш защищённых билдов (protected_builds) для отдачи лаунчеру.
+# Файл открывается один раз на процесс: неизменяемые (cas/, патчи) отображаются в память (mmap) и
+# отдаются memoryview-срезами без копий, текущие билды читаются через дескриптор (pread).
+# Текущий билд подменять только атомарно (publish_build.py или cp во временный файл + mv):
+# перезапись файла на месте не поддерживается — отдача в процессе получит смесь версий.
+# Открытие и хэширование — только при сканировании манифеста в потоке; запрос лишь ищет в словаре.
+import os
+import re
+import mmap
+import asyncio
+import hashlib
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from fastapi import APIRouter, Request, Depends
+from fastapi.responses import Response, StreamingResponse
+
+from guards import admin_guard_ui
+
+PROTECTED_BUILDS_DIR = os.getenv("PROTECTED_BUILDS_DIR", "/opt/fpbooster/protected_builds")
+# Размер куска, который отдаём в сокет за один раз
+ARTIFACT_CHUNK_SIZE = int(os.getenv("ARTIFACT_CHUNK_SIZE", str(256 * 1024)))
+# Опрос каталога, если watchfiles не установлен
+MANIFEST_POLL_SECONDS = int(os.getenv("ARTIFACT_MANIFEST_POLL_SECONDS", "10"))
+# Как часто перечитывать соответствие продукт -> файл из products (каталог при этом не сканируется)
+PRODUCTS_REFRESH_SECONDS = int(os.getenv("ARTIFACT_PRODUCTS_REFRESH_SECONDS", "60"))
+
+# Билды ядра для /api/client/get-core (ver -> файл); неизвестная версия — обычный билд
+CORE_DEFAULT_BUILD = "FPBooster.dll.enc"
+CORE_BUILDS = {
+    "standard": CORE_DEFAULT_BUILD,
+    "plus": "FPBooster_Plus.dll.enc",
+    "alpha": "FPBooster_Alpha.dll.enc",
+}
+# Форматы патчей между версиями (build_store.py); порядок — предпочтение при отдаче
+PATCH_FORMATS = ("bsdiff4", "zstd")
+# Content-Encoding -> расширение сжатого варианта в cas/; порядок — предпочтение сервера
+ENCODINGS = (("zstd", ".zst"), ("gzip", ".gz"))
+
+router = APIRouter(prefix="/admin/artifacts", tags=["Admin Artifacts"])
+
+
+class Artifact:
+    """
+    Файл для отдачи. Неизменяемые файлы (cas/, патчи — пишутся атомарно и по хэшу в имени)
+    отображаются в память. Текущие билды в корне каталога — нет: файл, перезаписанный на месте
+    под отображением, роняет процесс SIGBUS при чтении. Их читаем через дескриптор, открытый
+    при сканировании (после атомарной подмены он продолжает указывать на прежнюю версию).
+    Конструктор читает весь файл (sha256) — создавать только в ArtifactManifest._scan (в потоке).
+    """
+    __slots__ = ("path", "name", "size", "mtime", "ino", "sha256", "_map", "_fd")
+
+    def __init__(self, path: str, mapped: bool = True):
+        self._map = None
+        self._fd = None
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            st = os.fstat(fd)
+            self.path = path
+            self.name = os.path.basename(path)
+            self.size = st.st_size
+            self.mtime = st.st_mtime
+            self.ino = st.st_ino
+            # Хэш считается один раз на версию файла (ETag, список продуктов)
+            h = hashlib.sha256()
+            if mapped and self.size:
+                self._map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+                if hasattr(self._map, "madvise"):
+                    # Подтягиваем страницы заранее, чтобы чтение при отдаче не упиралось в диск
+                    self._map.madvise(mmap.MADV_WILLNEED)
+                h.update(self._map)
+            elif not mapped:
+                for pos in range(0, self.size, ARTIFACT_CHUNK_SIZE):
+                    h.update(os.pread(fd, ARTIFACT_CHUNK_SIZE, pos))
+                self._fd, fd = fd, None
+            self.sha256 = h.hexdigest()
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def __del__(self):
+        # Дескриптор закрывается, когда манифест заменил артефакт и текущие скачивания дочитали его
+        if getattr(self, "_fd", None) is not None:
+            os.close(self._fd)
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.sha256}"'
+
+    def view(self) -> memoryview:
+        return memoryview(self._map) if self._map is not None else memoryview(b"")
+
+    def iter_chunks(self, start: int = 0, end: Optional[int] = None):
+        """
+        Куски [start, end) по ARTIFACT_CHUNK_SIZE: срезы mmap без копий или pread из дескриптора.
+        Синхронный генератор — StreamingResponse вызывает его в пуле потоков.
+        Держит ссылку на артефакт (и его mmap/дескриптор) до конца отдачи.
+        """
+        end = self.size if end is None else end
+        view = self.view() if self._fd is None else None
+        pos = start
+        while pos < end:
+            nxt = min(pos + ARTIFACT_CHUNK_SIZE, end)
+            if view is not None:
+                yield view[pos:nxt]
+            else:
+                chunk = os.pread(self._fd, nxt - pos, pos)
+                if not chunk:
+                    # Файл урезали на месте — не поддерживается, обрываем отдачу
+                    return
+                yield chunk
+                nxt = pos + len(chunk)
+            pos = nxt
+
+
+def build_path(filename: str) -> str:
+    return os.path.join(PROTECTED_BUILDS_DIR, filename)
+
+
+def rel_path(artifact: Artifact) -> str:
+    return os.path.relpath(artifact.path, PROTECTED_BUILDS_DIR).replace(os.sep, "/")
+
+
+def release_dir(name: str) -> str:
+    return os.path.join(PROTECTED_BUILDS_DIR, "releases", name)
+
+
+def cas_path(sha256: str) -> str:
+    return os.path.join(PROTECTED_BUILDS_DIR, "cas", sha256[:2], sha256)
+
+
+class ArtifactManifest:
+    """
+    Что лежит в PROTECTED_BUILDS_DIR и какой файл у какого продукта.
+    Строится на старте и при изменениях каталога (watch_worker) или по кнопке в админке;
+    на запросе скачивания — один поиск в словаре, без os.path.exists по списку кандидатов.
+    Патчи к текущим версиям (releases/<name>/patches) и их сжатые варианты (cas/<ab>/<sha256>.gz|.zst)
+    индексируются тем же сканированием: build_store.publish подменяет текущий файл последним,
+    и его изменение пересобирает манифест.
+    """
+
+    def __init__(self):
+        self.files: Dict[str, Artifact] = {}
+        # имя билда -> {хэш версии клиента: (Artifact патча, формат)}
+        self.patches: Dict[str, Dict[str, Tuple[Artifact, str]]] = {}
+        # sha256 текущего билда -> {encoding: Artifact сжатого варианта}
+        self.variants: Dict[str, Dict[str, Artifact]] = {}
+        # путь относительно PROTECTED_BUILDS_DIR -> Artifact (всё, что отдаём; для offload.py)
+        self.paths: Dict[str, Artifact] = {}
+        self.products: Dict[int, dict] = {}
+        self.missing = []
+        self.built_at = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _load(path: str, st, known: Dict[str, Artifact], mapped: bool = True) -> Artifact:
+        old = known.get(path)
+        if old is not None and (old.size, old.mtime, old.ino) == (st.st_size, st.st_mtime, st.st_ino):
+            return old
+        return Artifact(path, mapped=mapped)
+
+    @classmethod
+    def _scan(cls, known: Dict[str, Artifact]):
+        """Сканирование каталога (в потоке). Неизменённые файлы не перехэшируются."""
+        files, patches, variants = {}, {}, {}
+        try:
+            entries = list(os.scandir(PROTECTED_BUILDS_DIR))
+        except FileNotFoundError:
+            return files, patches, variants
+        for entry in entries:
+            if not entry.is_file() or entry.name.endswith(".tmp"):
+                continue
+            # Текущие билды подменяет деплой — без mmap (см. Artifact)
+            files[entry.name] = cls._load(entry.path, os.stat(entry.path), known, mapped=False)
+        for name, artifact in files.items():
+            found = cls._scan_patches(name, artifact.sha256, known)
+            if found:
+                patches[name] = found
+            if artifact.sha256 not in variants:
+                found = cls._scan_variants(artifact.sha256, known)
+                if found:
+                    variants[artifact.sha256] = found
+        return files, patches, variants
+
+    @classmethod
+    def _scan_variants(cls, sha256: str, known: Dict[str, Artifact]) -> dict:
+        found = {}
+        for encoding, ext in ENCODINGS:
+            path = cas_path(sha256) + ext
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            found[encoding] = cls._load(path, st, known)
+        return found
+
+    @classmethod
+    def _scan_patches(cls, name: str, to_hash: str, known: Dict[str, Artifact]) -> dict:
+        """Патчи к текущей версии: {from: (Artifact, формат)}; из нескольких форматов — первый в PATCH_FORMATS."""
+        found = {}
+        try:
+            entries = list(os.scandir(os.path.join(release_dir(name), "patches")))
+        except (FileNotFoundError, NotADirectoryError):
+            return found
+        for entry in entries:
+            stem, _, fmt = entry.name.rpartition(".")
+            from_hash, _, target = stem.partition("-")
+            if target != to_hash or fmt not in PATCH_FORMATS or not entry.is_file():
+                continue
+            current = found.get(from_hash)
+            if current is None or PATCH_FORMATS.index(fmt) < PATCH_FORMATS.index(current[1]):
+                found[from_hash] = (cls._load(entry.path, entry.stat(), known), fmt)
+        return found
+
+    def _known(self) -> Dict[str, Artifact]:
+        known = {a.path: a for a in self.files.values()}
+        for found in self.patches.values():
+            known.update((a.path, a) for a, _ in found.values())
+        for found in self.variants.values():
+            known.update((a.path, a) for a in found.values())
+        return known
+
+    @staticmethod
+    async def _fetch_products(pool) -> list:
+        async with pool.acquire() as conn:
+            return await conn.fetch("SELECT id, name, exe_name, download_url, version FROM products ORDER BY id")
+
+    @staticmethod
+    def _map_products(rows, files: Dict[str, Artifact]):
+        products, missing = {}, []
+        for row in rows:
+            tried = product_filenames(row["id"], row)
+            fname = next((f for f in tried if f in files), None)
+            if fname is None:
+                missing.append({"product_id": row["id"], "name": row["name"], "tried": tried})
+            products[row["id"]] = {"file": fname, "version": row["version"]}
+        for ver, fname in CORE_BUILDS.items():
+            if fname not in files:
+                missing.append({"core": ver, "tried": [fname]})
+        return products, missing
+
+    async def rebuild(self, pool) -> dict:
+        async with self._lock:
+            files, patches, variants = await asyncio.to_thread(self._scan, self._known())
+            products, missing = self._map_products(await self._fetch_products(pool), files)
+
+            self.files, self.patches, self.variants = files, patches, variants
+            self.paths = {rel_path(a): a for a in self._known().values()}
+            self.products, self.missing = products, missing
+            self.built_at = datetime.utcnow()
+
+        for m in missing:
+            print(f"[Artifacts] MISSING build: {m}", flush=True)
+        return self.describe()
+
+    async def refresh_products(self, pool):
+        """Только соответствие продукт -> файл (новые/изменённые строки products), без сканирования каталога."""
+        async with self._lock:
+            self.products, self.missing = self._map_products(await self._fetch_products(pool), self.files)
+
+    def product(self, product_id: int, row=None) -> Optional[Artifact]:
+        """
+        row — свежая строка products (exe_name, download_url), если она уже есть у вызывающего:
+        файл выбирается по ней, так что добавленный или изменённый продукт отдаётся сразу,
+        не дожидаясь refresh_products.
+        """
+        if row is not None:
+            fname = next((f for f in product_filenames(product_id, row) if f in self.files), None)
+            return self.files.get(fname) if fname else None
+        entry = self.products.get(product_id)
+        return self.files.get(entry["file"]) if entry and entry["file"] else None
+
+    def patch(self, name: str, from_hash: str) -> Optional[Tuple[Artifact, str]]:
+        return self.patches.get(name, {}).get(from_hash)
+
+    def lookup(self, rel: str) -> Optional[Artifact]:
+        return self.paths.get(rel)
+
+    def variant(self, sha256: str, encoding: str) -> Optional[Artifact]:
+        return self.variants.get(sha256, {}).get(encoding)
+
+    def core(self, ver: str) -> Optional[Artifact]:
+        # Фолбэк (если запрошенного файла нет, отдаем обычный)
+        return self.files.get(CORE_BUILDS.get(ver, CORE_DEFAULT_BUILD)) or self.files.get(CORE_DEFAULT_BUILD)
+
+    def signature(self) -> dict:
+        return {name: (a.size, a.mtime, a.ino) for name, a in self.files.items()}
+
+    def describe(self) -> dict:
+        return {
+            "built_at": self.built_at.isoformat() + "Z" if self.built_at else None,
+            "dir": PROTECTED_BUILDS_DIR,
+            "files": {
+                name: {"size": a.size, "sha256": a.sha256, "mtime": a.mtime}
+                for name, a in sorted(self.files.items())
+            },
+            "patches": {
+                name: {h: {"format": fmt, "size": a.size} for h, (a, fmt) in found.items()}
+                for name, found in sorted(self.patches.items())
+            },
+            "variants": {
+                sha: {encoding: a.size for encoding, a in found.items()}
+                for sha, found in sorted(self.variants.items())
+            },
+            "products": self.products,
+            "missing": self.missing,
+        }
+
+
+manifest = ArtifactManifest()
+
+
+def _dir_signature() -> dict:
+    sig = {}
+    try:
+        for entry in os.scandir(PROTECTED_BUILDS_DIR):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                st = os.stat(entry.path)
+                sig[entry.name] = (st.st_size, st.st_mtime, st.st_ino)
+    except FileNotFoundError:
+        pass
+    return sig
+
+
+# --- WORKER ---
+async def watch_worker(app):
+    """
+    Пересобирает манифест при изменении каталога (watchfiles, если установлен, иначе опрос)
+    и раз в PRODUCTS_REFRESH_SECONDS перечитывает products — для списков продуктов в лаунчере.
+    """
+    await asyncio.gather(_watch_files(app), _refresh_products(app))
+
+
+async def _refresh_products(app):
+    while True:
+        await asyncio.sleep(PRODUCTS_REFRESH_SECONDS)
+        try:
+            await manifest.refresh_products(app.state.pool)
+        except Exception as e:
+            print(f"[Artifacts] products refresh error: {e}", flush=True)
+
+
+async def _watch_files(app):
+    try:
+        from watchfiles import awatch
+    except ImportError:
+        awatch = None
+
+    while True:
+        try:
+            if awatch is not None and os.path.isdir(PROTECTED_BUILDS_DIR):
+                async for _ in awatch(PROTECTED_BUILDS_DIR, recursive=False):
+                    await manifest.rebuild(app.state.pool)
+            else:
+                await asyncio.sleep(MANIFEST_POLL_SECONDS)
+                if await asyncio.to_thread(_dir_signature) != manifest.signature():
+                    await manifest.rebuild(app.state.pool)
+        except Exception as e:
+            print(f"[Artifacts] watcher error: {e}", flush=True)
+            await asyncio.sleep(MANIFEST_POLL_SECONDS)
+
+
+# --- API ---
+@router.get("")
+async def artifacts_manifest(request: Request, _=Depends(admin_guard_ui)):
+    return manifest.describe()
+
+
+@router.post("/refresh")
+async def artifacts_refresh(request: Request, _=Depends(admin_guard_ui)):
+    return await manifest.rebuild(request.app.state.pool)
+
+
+def product_filenames(product_id: int, prod) -> list:
+    """Список возможных имен файлов продукта (приоритетный порядок), prod — строка products."""
+    possible_filenames = []
+    if prod['exe_name']: possible_filenames.append(prod['exe_name'])
+    if prod['download_url']: possible_filenames.append(prod['download_url'])
+
+    # Фолбэки, если в базе странные данные
+    if product_id == 1: possible_filenames.append("FPBoosterPlus.dll")
+    if product_id == 2: possible_filenames.append("FPBoosterDefault.dll")
+    possible_filenames.append("FPBooster.exe")
+    return possible_filenames
+
+
+def product_artifact(product_id: int, row=None) -> Optional[Artifact]:
+    return manifest.product(product_id, row)
+
+
+def core_artifact(ver: str) -> Optional[Artifact]:
+    return manifest.core(ver)
+
+
+def artifact_info(artifact: Optional[Artifact]) -> dict:
+    """Хэш и размер билда для списков продуктов: лаунчер сверяет с локальной копией и не качает зря."""
+    if artifact is None:
+        return {"hash": None, "size": None}
+    return {"hash": artifact.sha256, "size": artifact.size}
+
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Один диапазон "bytes=a-b" / "bytes=a-" / "bytes=-n" -> (start, end) с end не включительно.
+    None — диапазон невыполним (416). Несколько диапазонов не поддерживаем — ValueError (отдаём весь файл).
+    """
+    m = _RANGE_RE.match(header.strip().replace(" ", ""))
+    if not m:
+        raise ValueError("unsupported range")
+    first, last = m.group(1), m.group(2)
+    if not first and not last:
+        raise ValueError("empty range")
+    if not first:
+        # Последние n байт
+        length = int(last)
+        if length == 0:
+            return None
+        return max(size - length, 0), size
+    start = int(first)
+    end = min(int(last) + 1, size) if last else size
+    if start >= size or start >= end:
+        return None
+    return start, end
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in [t.strip().removeprefix("W/") for t in header.split(",")]
+
+
+def artifact_response(request: Request, artifact: Artifact, headers: Optional[dict] = None,
+                      media_type: str = "application/octet-stream") -> Response:
+    """
+    Отдача артефакта с ETag (sha256 содержимого):
+      If-None-Match совпал        -> 304 без тела
+      Range (и If-Range совпал)   -> 206 с одним диапазоном (докачка)
+      невыполнимый Range          -> 416
+      иначе                       -> 200 с полным файлом
+    """
+    headers = dict(headers or {})
+    headers["ETag"] = artifact.etag
+    headers["Accept-Ranges"] = "bytes"
+    headers["Cache-Control"] = "private, no-cache"
+
+    if etag_matches(request.headers.get("if-none-match"), artifact.etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == artifact.etag):
+        try:
+            byte_range = parse_range(range_header, artifact.size)
+        except ValueError:
+            byte_range = (0, artifact.size)
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{artifact.size}"
+            return Response(status_code=416, headers=headers)
+        start, end = byte_range
+        if (start, end) != (0, artifact.size):
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{artifact.size}"
+            headers["Content-Length"] = str(end - start)
+            return StreamingResponse(
+                artifact.iter_chunks(start, end), status_code=206, media_type=media_type, headers=headers
+            )
+
+    headers["Content-Length"] = str(artifact.size)
+    return StreamingResponse(artifact.iter_chunks(), media_type=media_type, headers=headers)
@@ -0,0 +1,228 @@
+# assets.py
+# Статика с отпечатком содержимого в имени (/assets/...), собранная scripts/build_assets.py.
+# Шаблоны получают URL через asset_url('/templates_css/index.css'): есть в манифесте —
+# отдаём версию с хэшем (Cache-Control: immutable), нет (сборку не запускали) — исходный путь.
+# ASSETS_DIR — симлинк на текущую сборку в ASSETS_BUILDS_DIR; деплой переключает его атомарно,
+# воркеры замечают это сами (ASSETS_RELOAD_SECONDS), а файлы предыдущих сборок продолжают отдаваться.
+import os
+import json
+import time
+import mimetypes
+
+from fastapi import HTTPException
+from fastapi.staticfiles import StaticFiles
+from markupsafe import Markup, escape
+
+ASSETS_DIR = os.getenv("ASSETS_DIR", "static_build")
+ASSETS_BUILDS_DIR = os.getenv("ASSETS_BUILDS_DIR", ASSETS_DIR.rstrip("/\\") + ".builds")
+ASSETS_RELOAD_SECONDS = float(os.getenv("ASSETS_RELOAD_SECONDS", "5"))
+ASSETS_PREFIX = "/assets"
+MANIFEST_NAME = "manifest.json"
+# WebP/AVIF-варианты картинок по ширине (scripts/build_images.py)
+IMAGES_MANIFEST = "images.json"
+# Служебные файлы сборки — через /assets не отдаются
+PRIVATE_FILES = {MANIFEST_NAME, IMAGES_MANIFEST}
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# Предварительно сжатые варианты: Content-Encoding -> расширение (порядок — предпочтение)
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+_manifest = {}
+_images = {}
+_dirs = []
+_loaded_key = None
+_checked_at = 0.0
+
+
+def _read_json(root: str, name: str) -> dict:
+    try:
+        with open(os.path.join(root, name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _build_key(root: str):
+    try:
+        return root, os.stat(os.path.join(root, MANIFEST_NAME)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _asset_dirs(current: str) -> list:
+    """Текущая сборка, затем сохранённые предыдущие (новые раньше) — для ссылок из закэшированных страниц."""
+    dirs = [current]
+    try:
+        names = sorted(os.listdir(ASSETS_BUILDS_DIR), reverse=True)
+    except FileNotFoundError:
+        return dirs
+    for name in names:
+        path = os.path.realpath(os.path.join(ASSETS_BUILDS_DIR, name))
+        if path != current and not name.endswith(".tmp") and os.path.isdir(path):
+            dirs.append(path)
+    return dirs
+
+
+def load_manifest() -> int:
+    """Читает static_build/manifest.json ("/templates_css/index.css" -> "/assets/templates_css/index.<hash>.css")."""
+    global _manifest, _images, _dirs, _loaded_key, _checked_at
+    # Оба файла — из одной сборки, даже если симлинк переключат между чтениями
+    root = os.path.realpath(ASSETS_DIR)
+    _loaded_key = _build_key(root)
+    _manifest = _read_json(root, MANIFEST_NAME)
+    _images = _read_json(root, IMAGES_MANIFEST)
+    _dirs = _asset_dirs(root)
+    _checked_at = time.monotonic()
+    return len(_manifest)
+
+
+def _maybe_reload():
+    """Не чаще раза в ASSETS_RELOAD_SECONDS: симлинк указывает на другую сборку — перечитываем."""
+    global _checked_at
+    now = time.monotonic()
+    if now - _checked_at < ASSETS_RELOAD_SECONDS:
+        return
+    _checked_at = now
+    if _build_key(os.path.realpath(ASSETS_DIR)) != _loaded_key:
+        load_manifest()
+
+
+def asset_url(path: str) -> str:
+    _maybe_reload()
+    return _manifest.get(path.split("?", 1)[0], path)
+
+
+def srcset(src: str, mime: str = "image/webp") -> str:
+    _maybe_reload()
+    variants = _images.get(src, {}).get("variants", {}).get(mime) or []
+    return ", ".join(f"{url} {w}w" for url, w in variants)
+
+
+def _attrs(attrs: dict) -> str:
+    # class_ -> class (class — ключевое слово в Python)
+    return "".join(
+        f' {k.rstrip("_").replace("_", "-")}="{escape(v)}"' for k, v in attrs.items() if v is not None
+    )
+
+
+def picture(src: str, alt: str = "", sizes: str = "100vw", **attrs) -> Markup:
+    """
+    <picture> с AVIF/WebP srcset (если картинка есть в images.json) и обычным <img> как запасным.
+    width/height исходника проставляются в <img>, чтобы вёрстка не прыгала при загрузке.
+    """
+    _maybe_reload()
+    info = _images.get(src)
+    img_attrs = {"src": asset_url(src), "alt": alt}
+    if info:
+        img_attrs.update(width=info["width"], height=info["height"])
+    img_attrs.update(attrs)
+    img = f"<img{_attrs(img_attrs)}>"
+    if not info:
+        return Markup(img)
+
+    sources = "".join(
+        f'<source type="{mime}" srcset="{escape(srcset(src, mime))}" sizes="{escape(sizes)}">'
+        for mime in ("image/avif", "image/webp")
+        if info["variants"].get(mime)
+    )
+    return Markup(f"<picture>{sources}{img}</picture>")
+
+
+def image_set(src: str, width: int = 1920) -> str:
+    """
+    Значение background-image для CSS: image-set() с наименьшим вариантом не уже width.
+    Вставляется после обычного url(...) — старые браузеры оставят его.
+    """
+    _maybe_reload()
+    info = _images.get(src)
+    if not info:
+        return f"url('{asset_url(src)}')"
+    parts = []
+    for mime in ("image/avif", "image/webp"):
+        variants = info["variants"].get(mime) or []
+        fit = [v for v in variants if v[1] >= width] or variants[-1:]
+        if fit:
+            parts.append(f"url('{fit[0][0]}') type('{mime}')")
+    parts.append(f"url('{asset_url(src)}') type('image/png')")
+    return f"image-set({', '.join(parts)})"
+
+
+def install(templates):
+    """Регистрирует asset_url / picture / srcset / image_set в окружении Jinja2Templates."""
+    templates.env.globals["asset_url"] = asset_url
+    templates.env.globals["picture"] = picture
+    templates.env.globals["srcset"] = srcset
+    templates.env.globals["image_set"] = image_set
+    return templates
+
+
+def _accepted(scope) -> set:
+    header = ""
+    for name, value in scope.get("headers", []):
+        if name == b"accept-encoding":
+            header = value.decode("latin-1")
+            break
+    accepted = set()
+    for part in header.split(","):
+        token, _, params = part.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if token.strip():
+            accepted.add(token.strip().lower())
+    return accepted
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    Раздача /assets: имена уже содержат хэш, поэтому кэш навсегда.
+    Если рядом лежит .br/.gz и клиент его принимает — отдаём его с Content-Encoding.
+    Файл ищется в текущей сборке, затем в сохранённых предыдущих; манифесты не отдаются.
+    Каталоги берутся из load_manifest — сборка может появиться и после старта процесса.
+    """
+
+    async def check_config(self):
+        # Сборки может ещё не быть: до неё просто 404 (asset_url пока отдаёт исходные пути)
+        return
+
+    async def get_response(self, path: str, scope):
+        if path in PRIVATE_FILES:
+            raise HTTPException(status_code=404)
+        _maybe_reload()
+        if _dirs:
+            self.all_directories = _dirs
+
+        accepted = _accepted(scope)
+        for encoding, ext in PRECOMPRESSED:
+            if encoding not in accepted:
+                continue
+            try:
+                response = await super().get_response(path + ext, scope)
+            except Exception:
+                continue
+            if response.status_code in (200, 304):
+                response.headers["Content-Encoding"] = encoding
+                response.headers["Content-Type"] = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                break
+        else:
+            response = await super().get_response(path, scope)
+
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+def mount(app):
+    """
+    Подключает /assets всегда: сборку, выложенную после старта, воркер подхватит сам (_maybe_reload),
+    и ссылки asset_url на неё должны сразу открываться. Пока сборки нет — шаблоны ссылаются на исходные пути.
+    """
+    count = load_manifest()
+    app.mount(ASSETS_PREFIX, ImmutableStaticFiles(directory=ASSETS_DIR, check_dir=False), name="assets")
+    if not count:
+        print(f"[Assets] {ASSETS_DIR}/{MANIFEST_NAME} not found — serving unfingerprinted static until a build appears")
+    return count
@@ -1,11 +1,10 @@
 # auth/email_confirm.py
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
 from datetime import datetime
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 
 @router.get("/confirm", response_class=HTMLResponse)
 async def confirm_email(request: Request, token: str):
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Request, Form, Body, Depends, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import date, datetime, timedelta
@@ -10,9 +10,10 @@ import string
 from .jwt_utils import hash_password, verify_password, make_jwt
 from .guards import get_current_user
 from .email_service import create_and_send_confirmation
+from group_catalog import catalog
+import artifacts
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 
 # === МОДЕЛИ ===
 class LauncherLoginModel(BaseModel):
@@ -26,6 +27,8 @@ class ProductSchema(BaseModel):
     image_url: str
     download_url: str
     version: str
+    hash: Optional[str] = None
+    size: Optional[int] = None
 
 class UserProfileSchema(BaseModel):
     uid: str
@@ -236,15 +239,15 @@ async def activate_license(request: Request, license_key: str = Form(...)):
         async with request.app.state.pool.acquire() as conn:
             async with conn.transaction():
                 # 2. Ищем ключ в таблице group_keys
-                # Сразу получаем имя группы для красивого вывода в истории
+                # Имя группы для истории берём из справочника в памяти
                 key_data = await conn.fetchrow("""
-                    SELECT k.id, k.group_id, k.duration_days, g.name as group_name
+                    SELECT k.id, k.group_id, k.duration_days
                     FROM group_keys k
-                    JOIN groups g ON k.group_id = g.id
                     WHERE k.key_code = $1 AND k.is_used = FALSE
                 """, key_value)
+                group = await catalog.resolve_id(key_data['group_id'], conn) if key_data else None
 
-                if not key_data:
+                if not key_data or not group:
                     return templates.TemplateResponse("activation_result.html", {
                         "request": request, 
                         "user": user, 
@@ -255,7 +258,7 @@ async def activate_license(request: Request, license_key: str = Form(...)):
                 key_id = key_data['id']
                 group_id = key_data['group_id']
                 duration = key_data['duration_days']
-                group_name = key_data['group_name']
+                group_name = group['name']
                 user_uid = user['uid']
                 
                 # 3. Проверяем текущую подписку на ЭТУ конкретную группу
@@ -422,7 +425,8 @@ async def get_my_profile(request: Request, user=Depends(get_current_user)):
                     "description": p['description'],
                     "image_url": p['image_url'],
                     "download_url": f"/api/download/{p['id']}", # Генерируем ссылку на скачивание
-                    "version": p['version']
+                    "version": p['version'],
+                    **artifacts.artifact_info(artifacts.product_artifact(p['id']))
                 })
 
     return {
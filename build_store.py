@@ -0,0 +1,253 @@
+# build_store.py
+# Версионированное хранилище защищённых билдов и бинарных патчей между версиями.
+#
+#   PROTECTED_BUILDS_DIR/<name>                               — текущая версия (её отдаёт /api/download)
+#   PROTECTED_BUILDS_DIR/cas/<ab>/<sha256>[.gz|.zst]          — содержимое по хэшу + сжатые варианты
+#   PROTECTED_BUILDS_DIR/releases/<name>/index.json           — список версий, новые в конце
+#   PROTECTED_BUILDS_DIR/releases/<name>/patches/<from>-<to>.<format>
+#
+# Публикует scripts/publish_build.py. Патч строится от нескольких предыдущих версий к новой,
+# форматы — bsdiff4 и zstd с прошлой версией в роли словаря (что установлено; берём меньший).
+# Сжатые варианты (gzip, zstd) тоже готовятся один раз при публикации, на запросе — только выбор.
+import os
+import gzip
+import json
+import shutil
+import hashlib
+from datetime import datetime
+from typing import Optional, Tuple
+
+import artifacts
+from artifacts import PROTECTED_BUILDS_DIR, PATCH_FORMATS, ENCODINGS, release_dir, cas_path
+
+try:
+    import bsdiff4
+except ImportError:
+    bsdiff4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# От скольких предыдущих версий строить патч к новой
+PATCH_HISTORY = int(os.getenv("BUILD_PATCH_HISTORY", "3"))
+# Патч, который весит больше этой доли полного файла, не храним — проще отдать файл
+PATCH_MAX_RATIO = float(os.getenv("BUILD_PATCH_MAX_RATIO", "0.5"))
+# Сжатый вариант храним, только если он заметно меньше (зашифрованные .enc почти не жмутся)
+VARIANT_MAX_RATIO = float(os.getenv("BUILD_VARIANT_MAX_RATIO", "0.9"))
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_index(name: str) -> list:
+    try:
+        with open(os.path.join(release_dir(name), "index.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# ===== Построение патчей (только при публикации) =====
+
+def make_patch(old: bytes, new: bytes) -> Optional[Tuple[bytes, str]]:
+    """Самый маленький патч из доступных форматов или None, если библиотек нет."""
+    candidates = []
+    if bsdiff4 is not None:
+        candidates.append((bsdiff4.diff(old, new), "bsdiff4"))
+    if zstandard is not None:
+        # Старая версия — "сырой" словарь: клиент распаковывает с тем же словарём (zstd --patch-from)
+        window_log = min(max(max(len(old), len(new)).bit_length() + 1, 10), 31)
+        params = zstandard.ZstdCompressionParameters.from_level(19, window_log=window_log)
+        dict_data = zstandard.ZstdCompressionDict(old, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+        candidates.append((zstandard.ZstdCompressor(dict_data=dict_data, compression_params=params).compress(new), "zstd"))
+    if not candidates:
+        return None
+    return min(candidates, key=lambda c: (len(c[0]), PATCH_FORMATS.index(c[1])))
+
+
+def write_variants(sha256: str, data: bytes) -> dict:
+    """gzip/zstd-варианты содержимого рядом с ним в cas/. Возвращает {encoding: размер}."""
+    made = {}
+    for encoding, ext in ENCODINGS:
+        if encoding == "zstd":
+            if zstandard is None:
+                continue
+            packed = zstandard.ZstdCompressor(level=19).compress(data)
+        else:
+            packed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(packed) > len(data) * VARIANT_MAX_RATIO:
+            continue
+        _write_atomic(cas_path(sha256) + ext, packed)
+        made[encoding] = len(packed)
+    return made
+
+
+def publish(src: str, name: Optional[str] = None) -> dict:
+    """
+    Публикует файл как новую версию билда name:
+    копия в cas/ (версии старой раскладки переносятся туда же), патчи от PATCH_HISTORY предыдущих версий,
+    затем атомарная подмена текущего файла.
+    """
+    name = name or os.path.basename(src)
+    rdir = release_dir(name)
+    os.makedirs(os.path.join(rdir, "patches"), exist_ok=True)
+    migrate_legacy(name)
+
+    new_hash = sha256_file(src)
+    index = load_index(name)
+    if index and index[-1]["sha256"] == new_hash:
+        return {"name": name, "sha256": new_hash, "status": "unchanged", "patches": []}
+
+    stored = cas_path(new_hash)
+    if not os.path.exists(stored):
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        shutil.copyfile(src, stored + ".tmp")
+        os.replace(stored + ".tmp", stored)
+
+    with open(stored, "rb") as f:
+        new_bytes = f.read()
+    variants = write_variants(new_hash, new_bytes)
+
+    patches = []
+    previous = [v for v in index if v["sha256"] != new_hash][-PATCH_HISTORY:]
+    for version in previous:
+        old_path = cas_path(version["sha256"])
+        if not os.path.exists(old_path):
+            continue
+        with open(old_path, "rb") as f:
+            result = make_patch(f.read(), new_bytes)
+        if result is None:
+            break
+        data, fmt = result
+        if len(data) > len(new_bytes) * PATCH_MAX_RATIO:
+            continue
+        _write_atomic(os.path.join(rdir, "patches", f"{version['sha256']}-{new_hash}.{fmt}"), data)
+        patches.append({"from": version["sha256"], "format": fmt, "size": len(data)})
+
+    index = [v for v in index if v["sha256"] != new_hash]
+    index.append({
+        "sha256": new_hash,
+        "size": len(new_bytes),
+        "published_at": datetime.utcnow().isoformat() + "Z",
+    })
+    _write_atomic(os.path.join(rdir, "index.json"), json.dumps(index, indent=2).encode("utf-8"))
+
+    # Текущая версия — последней, когда патчи уже на месте
+    live = os.path.join(PROTECTED_BUILDS_DIR, name)
+    shutil.copyfile(stored, live + ".tmp")
+    os.replace(live + ".tmp", live)
+
+    return {
+        "name": name, "sha256": new_hash, "size": len(new_bytes), "status": "published",
+        "variants": variants, "patches": patches,
+    }
+
+
+def migrate_legacy(name: str) -> list:
+    """
+    Версии, опубликованные до cas/, лежат как releases/<name>/<sha256>. Переносит их в cas/
+    и строит сжатые варианты, чтобы от них снова строились патчи, а текущая версия отдавалась сжатой.
+    Повторный запуск ничего не делает. Возвращает хэши перенесённых версий.
+    """
+    moved = []
+    for version in load_index(name):
+        legacy = os.path.join(release_dir(name), version["sha256"])
+        if not os.path.isfile(legacy):
+            continue
+        stored = cas_path(version["sha256"])
+        if os.path.exists(stored):
+            os.remove(legacy)
+            continue
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        os.replace(legacy, stored)
+        with open(stored, "rb") as f:
+            write_variants(version["sha256"], f.read())
+        moved.append(version["sha256"])
+
+    live = os.path.join(PROTECTED_BUILDS_DIR, name)
+    if moved and os.path.exists(live):
+        # Новые варианты лежат в cas/, за которым watch_worker не следит — пересобираем манифест через mtime
+        os.utime(live)
+    return moved
+
+
+def migrate_all() -> dict:
+    """migrate_legacy для всех билдов в releases/."""
+    try:
+        names = sorted(os.listdir(os.path.join(PROTECTED_BUILDS_DIR, "releases")))
+    except FileNotFoundError:
+        return {}
+    return {name: migrate_legacy(name) for name in names if os.path.isdir(release_dir(name))}
+
+
+# ===== Отдача =====
+
+def patch_for(artifact, from_hash: Optional[str]):
+    """
+    Патч от версии клиента from_hash к текущему артефакту: (Artifact патча, формат) или None.
+    Без патча (нет такой пары, неизвестный хэш, клиент уже на текущей) — отдаём полный файл.
+    """
+    if not from_hash or from_hash.lower() == artifact.sha256:
+        return None
+    # Готовые патчи к текущей версии — в манифесте (artifacts.py), на запросе диск не трогаем
+    return artifacts.manifest.patch(artifact.name, from_hash.lower())
+
+
+def patch_headers(artifact, from_hash: str, fmt: str) -> dict:
+    return {
+        "X-Patch-Format": fmt,
+        "X-Patch-From": from_hash.lower(),
+        "X-Build-Hash": artifact.sha256,
+        "Content-Disposition": f'attachment; filename="{artifact.name}.{fmt}"',
+    }
+
+
+def _accepted_encodings(header: Optional[str]) -> set:
+    accepted = set()
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if token:
+            accepted.add(token.strip().lower())
+    return accepted
+
+
+def encoded_variant(request, artifact):
+    """
+    Готовый сжатый вариант билда под Accept-Encoding клиента: (Artifact варианта, encoding)
+    или (artifact, None), если клиент не умеет / вариант не построен.
+    """
+    accepted = _accepted_encodings(request.headers.get("accept-encoding"))
+    for encoding, _ in ENCODINGS:
+        if encoding in accepted:
+            variant = artifacts.manifest.variant(artifact.sha256, encoding)
+            if variant is not None:
+                return variant, encoding
+    return artifact, None
+
+
+def variant_headers(artifact, encoding: Optional[str]) -> dict:
+    """X-Content-SHA256 — хэш исходного (распакованного) билда для проверки целостности."""
+    headers = {"Vary": "Accept-Encoding", "X-Content-SHA256": artifact.sha256}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return headers
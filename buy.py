@@ -1,14 +1,16 @@
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
 from auth.guards import get_current_user
+import page_cache
 
-templates = Jinja2Templates(directory="templates")
 router = APIRouter()
 
 # === КОНФИГУРАЦИЯ ТАРИФОВ ===
 # Мы добавили поле 'group_slug', чтобы связать тарифы с новой системой групп.
 # payment_router будет читать это поле при успешной оплате.
+# Картинки /static/products/*.png собираются из templates/*days.png (scripts/build_images.py,
+# EXTRA_SOURCES) и доступны только после scripts/build_assets.py — через picture()/asset_url.
 
 PLANS = {
     # === СТАНДАРТНАЯ ВЕРСИЯ (FPBooster Basic) ===
@@ -126,6 +128,14 @@ PLANS = {
 
 @router.get("/buy", response_class=HTMLResponse)
 async def buy_page(request: Request):
+    # Для гостя страница зависит только от PLANS — отдаём из кэша
+    if page_cache.is_anonymous(request):
+        return page_cache.cached_response(request, "/buy", lambda: templates.TemplateResponse("buy.html", {
+            "request": request,
+            "plans": PLANS.values(),
+            "user": None
+        }))
+
     user = None
     try:
         # Корректное получение пользователя для шапки сайта
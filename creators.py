@@ -1,11 +1,10 @@
 # creators.py
 from fastapi import APIRouter, Request, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
 import bcrypt
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 
 @router.get("/creators/login", response_class=HTMLResponse)
 async def creator_login_form(request: Request):
@@ -0,0 +1,18 @@
+-- db/migrations/003_janitor_archive.sql
+-- Архивные таблицы для janitor.py (используются только при JANITOR_ARCHIVE=1).
+-- Структура = исходная таблица + archived_at в конце.
+
+CREATE TABLE IF NOT EXISTS email_confirmations_archive (LIKE email_confirmations);
+ALTER TABLE email_confirmations_archive ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP DEFAULT NOW();
+
+CREATE TABLE IF NOT EXISTS group_keys_archive (LIKE group_keys);
+ALTER TABLE group_keys_archive ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP DEFAULT NOW();
+
+CREATE TABLE IF NOT EXISTS autobump_tasks_archive (LIKE autobump_tasks);
+ALTER TABLE autobump_tasks_archive ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP DEFAULT NOW();
+
+-- Индексы под выборки janitor (иначе каждый батч — seq scan)
+CREATE INDEX IF NOT EXISTS idx_email_confirmations_created_at ON email_confirmations (created_at);
+-- То же выражение, что в условии janitor (COALESCE(used_at, created_at)), иначе индекс не используется
+CREATE INDEX IF NOT EXISTS idx_group_keys_used_expiry ON group_keys ((COALESCE(used_at, created_at))) WHERE is_used = TRUE;
+CREATE INDEX IF NOT EXISTS idx_user_groups_active_expires ON user_groups (expires_at) WHERE is_active = TRUE;
@@ -0,0 +1,13 @@
+-- db/migrations/004_processed_invoices.sql
+-- Журнал обработанных счетов PayPalych. Повторный postback с тем же InvId
+-- отдаёт сохранённый result и не трогает licenses/user_groups/purchases.
+
+CREATE TABLE IF NOT EXISTS processed_invoices (
+  inv_id TEXT PRIMARY KEY,
+  user_uid UUID,
+  plan TEXT,
+  amount TEXT,
+  currency TEXT,
+  result JSONB NOT NULL,
+  processed_at TIMESTAMP DEFAULT NOW()
+);
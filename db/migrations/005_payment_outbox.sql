@@ -0,0 +1,25 @@
+-- db/migrations/005_payment_outbox.sql
+-- Outbox для postback'ов PayPalych: /payment/result только пишет строку сюда,
+-- выдачу делает payments.outbox_worker.
+--   status: pending -> processing -> done
+--                                 -> pending (повтор, next_attempt_at)
+--                                 -> dead (исчерпаны попытки)
+
+CREATE TABLE IF NOT EXISTS payment_outbox (
+  id BIGSERIAL PRIMARY KEY,
+  inv_id TEXT UNIQUE NOT NULL,
+  payload JSONB NOT NULL,
+  status TEXT NOT NULL DEFAULT 'pending',
+  attempts INT NOT NULL DEFAULT 0,
+  next_attempt_at TIMESTAMP NOT NULL DEFAULT NOW(),
+  locked_at TIMESTAMP,
+  last_error TEXT,
+  created_at TIMESTAMP DEFAULT NOW(),
+  processed_at TIMESTAMP
+);
+
+-- Выборка воркера: только "живые" строки
+CREATE INDEX IF NOT EXISTS idx_payment_outbox_pending
+  ON payment_outbox (next_attempt_at, id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_payment_outbox_processing
+  ON payment_outbox (locked_at) WHERE status = 'processing';
@@ -0,0 +1,5 @@
+-- db/migrations/006_admin_users_keyset.sql
+-- Индексы под keyset-пагинацию /admin/users и подсчёт суммы покупок по странице.
+
+CREATE INDEX IF NOT EXISTS idx_users_created_at_id ON users (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_purchases_user_uid ON purchases (user_uid);
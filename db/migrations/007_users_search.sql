@@ -0,0 +1,13 @@
+-- db/migrations/007_users_search.sql
+-- Индексы для поиска пользователей в админке (user_search.py).
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Подстрока '%q%' (ILIKE) по email / логину / UID
+CREATE INDEX IF NOT EXISTS idx_users_email_trgm ON users USING gin (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_username_trgm ON users USING gin (username gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_uid_trgm ON users USING gin ((uid::text) gin_trgm_ops);
+
+-- Префиксы 'q%' (LIKE) по email и UID
+CREATE INDEX IF NOT EXISTS idx_users_email_prefix ON users (email text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_users_uid_prefix ON users ((uid::text) text_pattern_ops);
@@ -0,0 +1,17 @@
+-- db/migrations/008_key_batches.sql
+-- Партии ключей (key_batches.py): массовая генерация через COPY и выгрузка партии.
+
+CREATE TABLE IF NOT EXISTS key_batches (
+  id SERIAL PRIMARY KEY,
+  group_id INT REFERENCES groups(id) ON DELETE SET NULL,
+  duration_days INT NOT NULL,
+  requested_count INT NOT NULL,
+  created_count INT,
+  created_at TIMESTAMP DEFAULT NOW()
+);
+
+ALTER TABLE group_keys ADD COLUMN IF NOT EXISTS batch_id INT REFERENCES key_batches(id) ON DELETE SET NULL;
+
+-- ON CONFLICT (key_code) при генерации требует уникального индекса
+CREATE UNIQUE INDEX IF NOT EXISTS idx_group_keys_key_code ON group_keys (key_code);
+CREATE INDEX IF NOT EXISTS idx_group_keys_batch_id ON group_keys (batch_id, id);
@@ -0,0 +1,11 @@
+-- db/migrations/009_key_inventory.sql
+-- Индексы под инвентарь ключей (/admin/keys, /admin/tokens): keyset по (created_at, id)
+-- с фильтрами по группе/статусу, плюс сводка GROUP BY group_id, is_used (index-only scan).
+
+CREATE INDEX IF NOT EXISTS idx_group_keys_created_id ON group_keys (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_group_keys_group_used_created ON group_keys (group_id, is_used, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_group_keys_used_created ON group_keys (is_used, created_at DESC, id DESC);
+
+-- Партия: сортировка страницы тоже по (created_at, id)
+DROP INDEX IF EXISTS idx_group_keys_batch_id;
+CREATE INDEX IF NOT EXISTS idx_group_keys_batch_created ON group_keys (batch_id, created_at DESC, id DESC);
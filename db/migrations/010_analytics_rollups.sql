@@ -0,0 +1,35 @@
+-- db/migrations/010_analytics_rollups.sql
+-- Дневные сводки для /admin/analytics (analytics.py).
+-- analytics_watermarks хранит последний учтённый id исходной таблицы.
+
+CREATE TABLE IF NOT EXISTS analytics_watermarks (
+  name TEXT PRIMARY KEY,
+  last_id BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS analytics_daily_revenue (
+  day DATE NOT NULL,
+  plan TEXT NOT NULL,
+  source TEXT NOT NULL,
+  currency TEXT NOT NULL,
+  purchases INT NOT NULL DEFAULT 0,
+  amount NUMERIC NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, plan, source, currency)
+);
+
+CREATE TABLE IF NOT EXISTS analytics_daily_signups (
+  day DATE PRIMARY KEY,
+  users INT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS analytics_daily_activations (
+  day DATE PRIMARY KEY,
+  activations INT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS analytics_daily_active_subs (
+  day DATE NOT NULL,
+  group_id INT NOT NULL,
+  active INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, group_id)
+);
@@ -0,0 +1,14 @@
+-- db/migrations/011_user_groups_active.sql
+-- Частичные индексы по активным подпискам. Истёкшие строки снимает subscription_sweeper.py,
+-- поэтому предикат "is_active = TRUE AND expires_at > NOW()" читает только живые подписки.
+
+-- Проверка прав пользователя: WHERE user_uid = $1 AND is_active AND expires_at > NOW()
+CREATE INDEX IF NOT EXISTS idx_user_groups_active_uid_expires
+  ON user_groups (user_uid, expires_at)
+  WHERE is_active = TRUE;
+
+-- Выборку свипера (WHERE is_active AND expires_at <= NOW() ORDER BY expires_at) обслуживает
+-- idx_user_groups_active_expires из 003_janitor_archive.sql
+
+-- Одноразовая деактивация накопившихся истёкших строк (дальше это делает свипер)
+UPDATE user_groups SET is_active = FALSE WHERE is_active = TRUE AND expires_at <= NOW();
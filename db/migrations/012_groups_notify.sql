@@ -0,0 +1,15 @@
+-- db/migrations/012_groups_notify.sql
+-- Любое изменение groups шлёт NOTIFY groups_changed — процессы перечитывают
+-- справочник в памяти (group_catalog.py). Уведомление уходит при COMMIT.
+
+CREATE OR REPLACE FUNCTION notify_groups_changed() RETURNS trigger AS $$
+BEGIN
+  PERFORM pg_notify('groups_changed', TG_OP);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_groups_changed ON groups;
+CREATE TRIGGER trg_groups_changed
+  AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON groups
+  FOR EACH STATEMENT EXECUTE FUNCTION notify_groups_changed();
@@ -0,0 +1,127 @@
+# group_catalog.py
+# Справочник groups в памяти процесса (по id и по slug).
+# Загружается на старте, перечитывается по NOTIFY 'groups_changed'
+# (триггер из db/migrations/012_groups_notify.sql) и раз в GROUP_CATALOG_REFRESH_SECONDS на всякий случай.
+import os
+import time
+import asyncio
+from typing import Optional
+
+import asyncpg
+
+NOTIFY_CHANNEL = "groups_changed"
+GROUP_CATALOG_REFRESH_SECONDS = int(os.getenv("GROUP_CATALOG_REFRESH_SECONDS", "300"))
+# Промах по slug перечитывает справочник не чаще раза в N секунд (защита от мусорных slug)
+MISS_RELOAD_SECONDS = 5
+
+
+class GroupCatalog:
+    def __init__(self):
+        self.pool = None
+        self.by_id = {}
+        self.by_slug = {}
+        self.ordered = []
+        self.loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def load(self, executor=None) -> int:
+        """Перечитать groups. executor — пул или соединение (по умолчанию self.pool)."""
+        executor = executor or self.pool
+        async with self._lock:
+            rows = await executor.fetch("""
+                SELECT id, name, slug, is_admin_group, access_level
+                FROM groups
+                ORDER BY access_level ASC, id ASC
+            """)
+            groups = [dict(r) for r in rows]
+            # Подменяем целиком — читатели видят либо старый, либо новый справочник
+            self.by_id = {g["id"]: g for g in groups}
+            self.by_slug = {g["slug"]: g for g in groups}
+            self.ordered = groups
+            self.loaded_at = time.monotonic()
+        return len(groups)
+
+    def get(self, group_id: int) -> Optional[dict]:
+        return self.by_id.get(group_id)
+
+    def get_by_slug(self, slug: Optional[str]) -> Optional[dict]:
+        return self.by_slug.get(slug) if slug else None
+
+    def all(self) -> list:
+        """Все группы по access_level (для выпадающих списков)."""
+        return self.ordered
+
+    async def resolve_slug(self, slug: Optional[str], executor=None) -> Optional[dict]:
+        """
+        Группа по slug. Промах может означать, что группа только что создана,
+        а уведомление ещё не дошло — тогда один раз перечитываем справочник.
+        """
+        if not slug:
+            return None
+        group = self.by_slug.get(slug)
+        if group is None and time.monotonic() - self.loaded_at > MISS_RELOAD_SECONDS:
+            await self.load(executor)
+            group = self.by_slug.get(slug)
+        return group
+
+    async def resolve_id(self, group_id: Optional[int], executor=None) -> Optional[dict]:
+        """То же по id (ключ активации мог быть выпущен на группу, созданную на другом воркере)."""
+        if group_id is None:
+            return None
+        group = self.by_id.get(group_id)
+        if group is None and time.monotonic() - self.loaded_at > MISS_RELOAD_SECONDS:
+            await self.load(executor)
+            group = self.by_id.get(group_id)
+        return group
+
+
+catalog = GroupCatalog()
+
+# Ссылки на задачи перезагрузки: иначе незавершённую задачу может собрать GC
+_reload_tasks = set()
+
+
+def _on_notify(conn, pid, channel, payload):
+    task = asyncio.get_event_loop().create_task(_reload("notify"))
+    _reload_tasks.add(task)
+    task.add_done_callback(_reload_tasks.discard)
+
+
+async def _reload(reason: str):
+    try:
+        count = await catalog.load()
+        print(f"[Groups] catalog reloaded ({reason}): {count} groups", flush=True)
+    except Exception as e:
+        print(f"[Groups] catalog reload error: {e}", flush=True)
+
+
+async def start(app):
+    """Первая загрузка на старте (пул уже создан)."""
+    catalog.pool = app.state.pool
+    await catalog.load()
+    app.state.group_catalog = catalog
+
+
+# --- WORKER ---
+async def listen_worker(dsn: str):
+    """
+    Отдельное соединение под LISTEN (соединения пула для этого не годятся — их отдают другим).
+    При обрыве переподключаемся и перечитываем справочник: уведомления могли потеряться.
+    """
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(dsn=dsn)
+            await conn.add_listener(NOTIFY_CHANNEL, _on_notify)
+            await catalog.load()
+            while not conn.is_closed():
+                await asyncio.sleep(GROUP_CATALOG_REFRESH_SECONDS)
+                # Заодно проверяем, что соединение живо
+                await conn.execute("SELECT 1")
+                await catalog.load()
+        except Exception as e:
+            print(f"[Groups] listener error: {e}", flush=True)
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(5)
@@ -1,6 +1,6 @@
 # groups.py
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 import uuid
 
@@ -18,3 +18,12 @@ class AssignGroupRequest(BaseModel):
 class RevokeGroupRequest(BaseModel):
     user_uid: uuid.UUID
     group_slug: str
+
+class BulkAssignGroupRequest(BaseModel):
+    user_uids: List[uuid.UUID]
+    group_slug: str
+    duration_days: int = 30
+
+class BulkRevokeGroupRequest(BaseModel):
+    user_uids: List[uuid.UUID]
+    group_slug: str
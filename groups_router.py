@@ -1,14 +1,20 @@
-from fastapi import APIRouter, Request, HTTPException, Depends
+from fastapi import APIRouter, Request, HTTPException, Depends, UploadFile, File, Form
 from datetime import datetime, timedelta
+import csv
+import io
 import uuid
 
 # ИСПРАВЛЕНО: Импортируем из корневого файла guards.py
 from guards import admin_guard_api 
 
-from groups import AssignGroupRequest, RevokeGroupRequest
+from group_catalog import catalog
+from groups import AssignGroupRequest, RevokeGroupRequest, BulkAssignGroupRequest, BulkRevokeGroupRequest
 
 router = APIRouter(prefix="/admin/groups", tags=["Admin Groups"])
 
+# Максимум UID за один массовый запрос
+BULK_MAX_UIDS = 50000
+
 @router.post("/assign")
 async def assign_group_admin(request: Request, body: AssignGroupRequest, _=Depends(admin_guard_api)):
     """
@@ -16,8 +22,8 @@ async def assign_group_admin(request: Request, body: AssignGroupRequest, _=Depen
     """
     pool = request.app.state.pool
     async with pool.acquire() as conn:
-        # 1. Получаем ID группы
-        group = await conn.fetchrow("SELECT id, access_level FROM groups WHERE slug = $1", body.group_slug)
+        # 1. Получаем ID группы (справочник в памяти)
+        group = await catalog.resolve_slug(body.group_slug, conn)
         if not group:
             raise HTTPException(404, detail="Группа не найдена")
 
@@ -63,7 +69,7 @@ async def revoke_group_admin(request: Request, body: RevokeGroupRequest, _=Depen
     """
     pool = request.app.state.pool
     async with pool.acquire() as conn:
-        group = await conn.fetchrow("SELECT id FROM groups WHERE slug = $1", body.group_slug)
+        group = await catalog.resolve_slug(body.group_slug, conn)
         if not group:
             raise HTTPException(404, detail="Группа не найдена")
 
@@ -73,3 +79,153 @@ async def revoke_group_admin(request: Request, body: RevokeGroupRequest, _=Depen
         """, body.user_uid, group['id'])
 
     return {"status": "revoked"}
+
+
+# ==========================================================
+#             МАССОВАЯ ВЫДАЧА / СНЯТИЕ ГРУПП
+# ==========================================================
+
+async def _group_id_by_slug(conn, slug: str) -> int:
+    group = await catalog.resolve_slug(slug, conn)
+    if not group:
+        raise HTTPException(404, detail="Группа не найдена")
+    return group["id"]
+
+
+async def bulk_assign(pool, user_uids: list, group_slug: str, duration_days: int) -> list:
+    """
+    Выдача/продление одной группы списку пользователей одним запросом (unnest + ON CONFLICT).
+    Логика срока как в assign_group_admin: истекла — от сейчас, действует — от даты окончания.
+    """
+    if len(user_uids) > BULK_MAX_UIDS:
+        raise HTTPException(400, detail=f"Не больше {BULK_MAX_UIDS} пользователей за раз")
+    duration = duration_days if duration_days else 30
+
+    async with pool.acquire() as conn:
+        group_id = await _group_id_by_slug(conn, group_slug)
+        rows = await conn.fetch("""
+            WITH input AS (
+                SELECT DISTINCT unnest($1::uuid[]) AS user_uid
+            ),
+            known AS (
+                SELECT i.user_uid FROM input i JOIN users u ON u.uid = i.user_uid
+            ),
+            upserted AS (
+                INSERT INTO user_groups AS ug (user_uid, group_id, expires_at, is_active, granted_at)
+                SELECT user_uid, $2, NOW() + make_interval(days => $3), TRUE, NOW()
+                FROM known
+                ON CONFLICT (user_uid, group_id) DO UPDATE
+                SET expires_at = GREATEST(ug.expires_at, NOW()) + make_interval(days => $3),
+                    is_active = TRUE,
+                    granted_at = NOW()
+                RETURNING ug.user_uid, ug.expires_at, (xmax = 0) AS created
+            )
+            SELECT i.user_uid, up.expires_at, up.created
+            FROM input i
+            LEFT JOIN upserted up ON up.user_uid = i.user_uid
+        """, user_uids, group_id, duration)
+
+    results = []
+    for r in rows:
+        if r["expires_at"] is None:
+            results.append({"user_uid": str(r["user_uid"]), "status": "user_not_found"})
+        else:
+            results.append({
+                "user_uid": str(r["user_uid"]),
+                "status": "created" if r["created"] else "extended",
+                "new_expires": r["expires_at"],
+            })
+    return results
+
+
+async def bulk_revoke(pool, user_uids: list, group_slug: str) -> list:
+    """Снятие группы (is_active = FALSE) списку пользователей одним запросом."""
+    if len(user_uids) > BULK_MAX_UIDS:
+        raise HTTPException(400, detail=f"Не больше {BULK_MAX_UIDS} пользователей за раз")
+
+    async with pool.acquire() as conn:
+        group_id = await _group_id_by_slug(conn, group_slug)
+        rows = await conn.fetch("""
+            WITH input AS (
+                SELECT DISTINCT unnest($1::uuid[]) AS user_uid
+            ),
+            revoked AS (
+                UPDATE user_groups ug SET is_active = FALSE
+                FROM input i
+                WHERE ug.user_uid = i.user_uid AND ug.group_id = $2
+                RETURNING ug.user_uid
+            )
+            SELECT i.user_uid, (r.user_uid IS NOT NULL) AS revoked
+            FROM input i
+            LEFT JOIN revoked r ON r.user_uid = i.user_uid
+        """, user_uids, group_id)
+
+    return [
+        {"user_uid": str(r["user_uid"]), "status": "revoked" if r["revoked"] else "not_assigned"}
+        for r in rows
+    ]
+
+
+async def _uids_from_csv(file: UploadFile):
+    """UID из первой колонки CSV. Заголовок и мусорные строки попадают в invalid."""
+    raw = (await file.read()).decode("utf-8-sig", errors="replace")
+    uids, invalid = [], []
+    for row in csv.reader(io.StringIO(raw)):
+        if not row or not row[0].strip():
+            continue
+        cell = row[0].strip()
+        try:
+            uids.append(uuid.UUID(cell))
+        except ValueError:
+            invalid.append(cell)
+    return uids, invalid
+
+
+def _summary(results: list, invalid: list = None) -> dict:
+    counts = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    out = {"counts": counts, "results": results}
+    if invalid:
+        out["invalid"] = invalid
+    return out
+
+
+@router.post("/assign/bulk")
+async def assign_group_bulk(request: Request, body: BulkAssignGroupRequest, _=Depends(admin_guard_api)):
+    """Массовая выдача/продление группы по списку UID."""
+    results = await bulk_assign(request.app.state.pool, body.user_uids, body.group_slug, body.duration_days)
+    return _summary(results)
+
+
+@router.post("/assign/bulk_csv")
+async def assign_group_bulk_csv(
+    request: Request,
+    file: UploadFile = File(...),
+    group_slug: str = Form(...),
+    duration_days: int = Form(30),
+    _=Depends(admin_guard_api)
+):
+    """То же, но UID берутся из CSV (первая колонка)."""
+    uids, invalid = await _uids_from_csv(file)
+    results = await bulk_assign(request.app.state.pool, uids, group_slug, duration_days)
+    return _summary(results, invalid)
+
+
+@router.post("/revoke/bulk")
+async def revoke_group_bulk(request: Request, body: BulkRevokeGroupRequest, _=Depends(admin_guard_api)):
+    """Массовое снятие группы по списку UID."""
+    results = await bulk_revoke(request.app.state.pool, body.user_uids, body.group_slug)
+    return _summary(results)
+
+
+@router.post("/revoke/bulk_csv")
+async def revoke_group_bulk_csv(
+    request: Request,
+    file: UploadFile = File(...),
+    group_slug: str = Form(...),
+    _=Depends(admin_guard_api)
+):
+    uids, invalid = await _uids_from_csv(file)
+    results = await bulk_revoke(request.app.state.pool, uids, group_slug)
+    return _summary(results, invalid)
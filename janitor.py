@@ -0,0 +1,178 @@
+# janitor.py
+# Фоновая уборка таблиц: использованные/просроченные токены подтверждения,
+# старые использованные ключи и задачи AutoBump, выключенные самим плагином из-за ошибки.
+# Истёкшие подписки снимает subscription_sweeper.py.
+import os
+import asyncio
+import time
+from datetime import datetime
+
+from fastapi import APIRouter, Request, Depends
+
+from guards import admin_guard_ui
+
+router = APIRouter(prefix="/admin/janitor", tags=["Admin Janitor"])
+
+# ===== Конфиг (systemd env) =====
+JANITOR_ENABLED = os.getenv("JANITOR_ENABLED", "1") == "1"
+JANITOR_INTERVAL_SECONDS = int(os.getenv("JANITOR_INTERVAL_SECONDS", "600"))
+JANITOR_BATCH_SIZE = int(os.getenv("JANITOR_BATCH_SIZE", "500"))
+# Сколько батчей подряд максимум за один проход по одной таблице
+JANITOR_MAX_BATCHES = int(os.getenv("JANITOR_MAX_BATCHES", "20"))
+# Если 1 — строки перед удалением копируются в *_archive (см. db/migrations/003_janitor_archive.sql)
+JANITOR_ARCHIVE = os.getenv("JANITOR_ARCHIVE", "0") == "1"
+
+# Срок хранения (в днях) для каждого вида мусора
+RETENTION_DAYS = {
+    "email_confirmations": int(os.getenv("JANITOR_CONFIRMATIONS_DAYS", "7")),
+    "group_keys": int(os.getenv("JANITOR_USED_KEYS_DAYS", "90")),
+    "autobump_tasks": int(os.getenv("JANITOR_DEAD_TASKS_DAYS", "60")),
+}
+
+# Статусы, с которыми AutoBump выключает задачу сам (update_status(..., disable=True)): мёртвый ключ, нет лотов.
+# Поставленные пользователем на паузу задачи (сохранение настроек пишет другой статус) не трогаем —
+# в них зашифрованный golden key и лоты. AutoRestock задачи по ошибке не выключает, его таблицу не чистим.
+AUTOBUMP_DEAD_STATUSES = ("❌ Ошибка ключа", "❌ Нет лотов")
+
+# ===== Задачи уборки =====
+# table   - таблица
+# action  - delete (удалить / переложить в архив) или deactivate (is_active = FALSE)
+# where   - условие "мусорной" строки, $1 = срок хранения в днях
+# Выборка идёт по ctid, поэтому первичный ключ не нужен (у email_confirmations его нет).
+JOBS = [
+    {
+        "name": "email_confirmations",
+        "table": "email_confirmations",
+        "action": "delete",
+        "where": "(used = TRUE OR expires < NOW()) AND created_at < NOW() - make_interval(days => $1)",
+    },
+    {
+        "name": "group_keys",
+        "table": "group_keys",
+        "action": "delete",
+        "where": "is_used = TRUE AND COALESCE(used_at, created_at) < NOW() - make_interval(days => $1)",
+    },
+    {
+        # Задача выключена плагином из-за ошибки (AUTOBUMP_DEAD_STATUSES) и давно не трогалась
+        "name": "autobump_tasks",
+        "table": "autobump_tasks",
+        "action": "delete",
+        "where": f"""is_active = FALSE
+                     AND status_message IN ({", ".join(f"'{m}'" for m in AUTOBUMP_DEAD_STATUSES)})
+                     AND (last_bump_at IS NULL OR last_bump_at < NOW() - make_interval(days => $1))
+                     AND (last_manual_check_at IS NULL OR last_manual_check_at < NOW() - make_interval(days => $1))""",
+    },
+]
+
+
+def _batch_sql(job: dict, archive: bool) -> str:
+    """
+    Один батч: блокируем до N строк (SKIP LOCKED, чтобы не мешать живым запросам)
+    и удаляем/деактивируем их. Возвращает количество обработанных строк.
+    """
+    table = job["table"]
+    pick = f"""
+        SELECT ctid FROM {table}
+        WHERE {job['where']}
+        LIMIT $2
+        FOR UPDATE SKIP LOCKED
+    """
+    if job["action"] == "deactivate":
+        return f"""
+            WITH picked AS ({pick}),
+            done AS (
+                UPDATE {table} SET is_active = FALSE
+                WHERE ctid IN (SELECT ctid FROM picked)
+                RETURNING 1
+            )
+            SELECT COUNT(*) FROM done
+        """
+    if archive:
+        return f"""
+            WITH picked AS ({pick}),
+            moved AS (
+                DELETE FROM {table}
+                WHERE ctid IN (SELECT ctid FROM picked)
+                RETURNING *
+            ),
+            archived AS (
+                INSERT INTO {table}_archive
+                SELECT m.*, NOW() FROM moved m
+                RETURNING 1
+            )
+            SELECT COUNT(*) FROM archived
+        """
+    return f"""
+        WITH picked AS ({pick}),
+        done AS (
+            DELETE FROM {table}
+            WHERE ctid IN (SELECT ctid FROM picked)
+            RETURNING 1
+        )
+        SELECT COUNT(*) FROM done
+    """
+
+
+async def run_job(pool, job: dict) -> int:
+    """Прогоняет одну задачу батчами, пока есть что чистить (но не больше JANITOR_MAX_BATCHES)."""
+    sql = _batch_sql(job, JANITOR_ARCHIVE)
+    retention = RETENTION_DAYS.get(job["name"], 30)
+    total = 0
+    for _ in range(JANITOR_MAX_BATCHES):
+        # Каждый батч — отдельная короткая транзакция, блокировки не копятся
+        async with pool.acquire() as conn:
+            processed = await conn.fetchval(sql, retention, JANITOR_BATCH_SIZE) or 0
+        total += processed
+        if processed < JANITOR_BATCH_SIZE:
+            break
+        await asyncio.sleep(0.1)
+    return total
+
+
+async def run_once(app) -> dict:
+    """Один полный проход по всем задачам. Результат сохраняется в app.state.janitor_stats."""
+    started = time.monotonic()
+    report = {"started_at": datetime.utcnow().isoformat() + "Z", "rows": {}, "errors": {}}
+
+    for job in JOBS:
+        try:
+            report["rows"][job["name"]] = await run_job(app.state.pool, job)
+        except Exception as e:
+            # Таблицы может не быть (плагин не развернут) — не валим весь проход
+            report["errors"][job["name"]] = str(e)
+
+    report["duration_ms"] = int((time.monotonic() - started) * 1000)
+    app.state.janitor_stats = report
+
+    processed = sum(report["rows"].values())
+    if processed or report["errors"]:
+        print(f"[Janitor] processed={report['rows']} errors={list(report['errors'])} in {report['duration_ms']}ms", flush=True)
+    return report
+
+
+# --- WORKER ---
+async def worker(app):
+    await asyncio.sleep(30)
+    if not JANITOR_ENABLED:
+        print(">>> [Janitor] disabled", flush=True)
+        return
+    print(">>> [Janitor] WORKER STARTED", flush=True)
+
+    while True:
+        try:
+            if not hasattr(app.state, 'pool'): await asyncio.sleep(5); continue
+            await run_once(app)
+        except Exception as e:
+            print(f"[Janitor] error: {e}", flush=True)
+        await asyncio.sleep(JANITOR_INTERVAL_SECONDS)
+
+
+# --- API ---
+@router.get("/stats")
+async def janitor_stats(request: Request, _=Depends(admin_guard_ui)):
+    return getattr(request.app.state, "janitor_stats", None) or {"status": "not_run_yet"}
+
+
+@router.post("/run")
+async def janitor_run(request: Request, _=Depends(admin_guard_ui)):
+    return await run_once(request.app)
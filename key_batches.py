@@ -0,0 +1,240 @@
+# key_batches.py
+# Массовая генерация ключей group_keys партиями (batch) и выгрузка партии файлом.
+import os
+import time
+import asyncio
+import secrets
+from datetime import date, datetime, timedelta
+from typing import Literal, Optional
+from urllib.parse import quote
+
+from fastapi import APIRouter, Request, Depends, HTTPException
+
+from guards import admin_guard_ui
+from streaming import stream_query
+import pagination
+
+router = APIRouter(prefix="/admin/keys/batches", tags=["Admin Keys"])
+
+KEY_BATCH_MAX = int(os.getenv("KEY_BATCH_MAX", "200000"))
+# Сколько раз догенерировать ключи, если часть совпала с существующими
+KEY_COLLISION_RETRIES = 5
+# Сводка по группам/статусам пересчитывается не чаще раза в N секунд
+KEY_COUNTS_TTL = int(os.getenv("KEY_COUNTS_TTL", "30"))
+
+_counts_cache = {"at": 0.0, "rows": []}
+
+
+def generate_code() -> str:
+    # Формат XXXX-YYYY-ZZZZ (как и раньше)
+    return f"{secrets.token_hex(2)}-{secrets.token_hex(2)}-{secrets.token_hex(2)}".upper()
+
+
+def generate_codes(count: int) -> set:
+    codes = set()
+    while len(codes) < count:
+        codes.add(generate_code())
+    return codes
+
+
+def generate_records(count: int) -> list:
+    """Строки для COPY. 200k ключей — почти секунда CPU: вызывать через asyncio.to_thread."""
+    return [(c,) for c in generate_codes(count)]
+
+
+async def create_batch(pool, group_id: int, days: int, count: int) -> dict:
+    """
+    Создаёт партию из count ключей одной транзакцией:
+    COPY во временную таблицу -> INSERT ... ON CONFLICT DO NOTHING в group_keys.
+    Совпавшие с существующими коды догенерируются заново.
+    """
+    if count < 1 or count > KEY_BATCH_MAX:
+        raise HTTPException(400, f"Количество от 1 до {KEY_BATCH_MAX}")
+
+    # Генерация — в потоке и до открытия транзакции: цикл событий воркера не стоит
+    records = await asyncio.to_thread(generate_records, count)
+
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            batch_id = await conn.fetchval("""
+                INSERT INTO key_batches (group_id, duration_days, requested_count)
+                VALUES ($1, $2, $3) RETURNING id
+            """, group_id, days, count)
+
+            await conn.execute("CREATE TEMP TABLE tmp_key_codes (key_code TEXT) ON COMMIT DROP")
+
+            missing = count
+            for _ in range(KEY_COLLISION_RETRIES):
+                if records is None:
+                    records = await asyncio.to_thread(generate_records, missing)
+                await conn.copy_records_to_table("tmp_key_codes", records=records, columns=["key_code"])
+                records = None
+                status = await conn.execute("""
+                    INSERT INTO group_keys (key_code, group_id, duration_days, batch_id)
+                    SELECT key_code, $1, $2, $3 FROM tmp_key_codes
+                    ON CONFLICT (key_code) DO NOTHING
+                """, group_id, days, batch_id)
+                await conn.execute("TRUNCATE tmp_key_codes")
+
+                # status = "INSERT 0 <n>"
+                missing -= int(status.split()[-1])
+                if missing <= 0:
+                    break
+
+            if missing > 0:
+                raise HTTPException(500, "Не удалось сгенерировать уникальные ключи")
+
+            await conn.execute("UPDATE key_batches SET created_count = $1 WHERE id = $2", count, batch_id)
+
+    return {"batch_id": batch_id, "count": count}
+
+
+async def recent_batches(conn, limit: int = 10):
+    return await conn.fetch("""
+        SELECT b.id, b.duration_days, b.requested_count, b.created_count, b.created_at, g.name AS group_name
+        FROM key_batches b
+        LEFT JOIN groups g ON g.id = b.group_id
+        ORDER BY b.id DESC
+        LIMIT $1
+    """, limit)
+
+
+# ===== Инвентарь ключей (список с фильтрами) =====
+
+def build_key_filter(group_id: Optional[int] = None, status: Optional[str] = None,
+                     created_from: Optional[date] = None, created_to: Optional[date] = None,
+                     batch_id: Optional[int] = None, code: Optional[str] = None):
+    """
+    Условия по индексам из 009_key_inventory.sql. Возвращает (where-список, args).
+    Точный код ключа обслуживается уникальным индексом key_code.
+    """
+    where, args = [], []
+    if code:
+        args.append(code.strip().upper())
+        where.append(f"gk.key_code = ${len(args)}")
+    if group_id:
+        args.append(group_id)
+        where.append(f"gk.group_id = ${len(args)}")
+    if status in ("used", "unused"):
+        where.append("gk.is_used = TRUE" if status == "used" else "gk.is_used = FALSE")
+    if batch_id:
+        args.append(batch_id)
+        where.append(f"gk.batch_id = ${len(args)}")
+    if created_from:
+        args.append(datetime.combine(created_from, datetime.min.time()))
+        where.append(f"gk.created_at >= ${len(args)}")
+    if created_to:
+        # Включительно: весь день created_to
+        args.append(datetime.combine(created_to + timedelta(days=1), datetime.min.time()))
+        where.append(f"gk.created_at < ${len(args)}")
+    return where, args
+
+
+def parse_key_filters(params) -> dict:
+    """
+    Фильтры из query-строки. HTML-форма шлёт пустые поля как "",
+    поэтому разбираем вручную, а не через Optional[int] в сигнатуре.
+    """
+    def _int(name):
+        v = (params.get(name) or "").strip()
+        return int(v) if v.isdigit() else None
+
+    def _date(name):
+        try:
+            return date.fromisoformat((params.get(name) or "").strip())
+        except ValueError:
+            return None
+
+    status = params.get("status")
+    return {
+        "group_id": _int("group_id"),
+        "status": status if status in ("used", "unused") else None,
+        "created_from": _date("created_from"),
+        "created_to": _date("created_to"),
+        "batch_id": _int("batch_id"),
+        "code": (params.get("code") or "").strip() or None,
+    }
+
+
+def filters_query(filters: dict) -> str:
+    """Фильтры обратно в query-строку (для ссылок пагинации)."""
+    parts = []
+    for k, v in filters.items():
+        if v is not None:
+            parts.append(f"{k}={quote(str(v))}")
+    return "&".join(parts)
+
+
+async def list_keys(conn, filters: dict, cursor: Optional[str], direction: str, limit: Optional[int]) -> dict:
+    """Одна страница ключей (keyset по created_at, id) + курсоры."""
+    limit = pagination.clamp_page_size(limit)
+    position = pagination.decode_cursor(cursor)
+
+    where, args = build_key_filter(**filters)
+    if position:
+        where.append(pagination.keyset_clause(direction, len(args) + 1, "gk"))
+        args.extend(position)
+    else:
+        direction = "next"
+    args.append(limit + 1)
+
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+    order = "ASC" if direction == "prev" else "DESC"
+
+    rows = await conn.fetch(f"""
+        SELECT gk.id, gk.key_code, gk.duration_days, gk.is_used, gk.created_at, gk.batch_id,
+               g.name AS group_name
+        FROM group_keys gk
+        LEFT JOIN groups g ON gk.group_id = g.id
+        {where_sql}
+        ORDER BY gk.created_at {order}, gk.id {order}
+        LIMIT ${len(args)}
+    """, *args)
+
+    return pagination.build_page(rows, limit, direction, position is not None)
+
+
+async def key_counts(conn) -> list:
+    """
+    Сводка "группа x статус" одним GROUP BY (index-only scan по group_id, is_used).
+    Кэшируется на KEY_COUNTS_TTL секунд — на миллионах ключей это всё же полный проход индекса.
+    """
+    now = time.monotonic()
+    if now - _counts_cache["at"] < KEY_COUNTS_TTL:
+        return _counts_cache["rows"]
+
+    rows = await conn.fetch("""
+        SELECT c.group_id, g.name AS group_name,
+               COALESCE(c.unused, 0) AS unused, COALESCE(c.used, 0) AS used
+        FROM (
+            SELECT group_id,
+                   COUNT(*) FILTER (WHERE NOT is_used) AS unused,
+                   COUNT(*) FILTER (WHERE is_used) AS used
+            FROM group_keys
+            GROUP BY group_id
+        ) c
+        LEFT JOIN groups g ON g.id = c.group_id
+        ORDER BY g.access_level NULLS LAST, g.id
+    """)
+    _counts_cache["at"] = now
+    _counts_cache["rows"] = rows
+    return rows
+
+
+# --- API ---
+@router.get("/{batch_id}/export")
+async def export_batch(request: Request, batch_id: int, format: Literal["csv", "txt"] = "txt", _=Depends(admin_guard_ui)):
+    """Выгрузка ключей партии потоком (серверный курсор)."""
+    return stream_query(
+        request.app.state.pool,
+        """
+        SELECT gk.key_code, gk.duration_days, g.slug AS group_slug, gk.is_used, gk.created_at
+        FROM group_keys gk
+        LEFT JOIN groups g ON g.id = gk.group_id
+        WHERE gk.batch_id = $1
+        ORDER BY gk.id
+        """,
+        (batch_id,),
+        format,
+        f"keys_batch_{batch_id}",
+    )
@@ -0,0 +1,204 @@
+# offload.py
+# Отдача защищённых билдов фронтовым веб-сервером. Проверки (подписка, HWID) остаются в FastAPI,
+# а байты передаёт nginx/apache — воркеры gunicorn свободны для API во время массового обновления.
+#
+# DOWNLOAD_OFFLOAD:
+#   none        — как раньше, файл отдаёт Python (artifacts.artifact_response)
+#   accel       — X-Accel-Redirect на internal-location nginx (подпись secure_link_md5, короткоживущая)
+#   sendfile    — X-Sendfile с абсолютным путём (apache mod_xsendfile / lighttpd)
+#   signed_url  — 302 на подписанную ссылку DOWNLOAD_OFFLOAD_BASE_URL/<путь>?expires=&h=&sig=
+#
+# В signed_url заголовки итогового ответа (ключ шифрования, Content-Encoding сжатого варианта, данные
+# патча) едут в самой ссылке: h — зашифрованный ими JSON, покрытый подписью. Клиент, который проходит
+# 302 автоматически, иначе их не увидит. Восстанавливает их /internal/builds, поэтому base url должен
+# вести на это приложение (напрямую или через прокси/CDN).
+#
+# DOWNLOAD_OFFLOAD_EMULATE=1 — локальный режим без nginx: ответ с X-Accel-Redirect перехватывается
+# (accel_middleware), подпись проверяется, файл отдаёт само приложение. Для signed_url ту же проверку
+# делает /internal/builds/... (base url можно направить на само приложение); этот роутер
+# подключается только в режиме signed_url.
+#
+# Пример nginx для accel: internal закрывает location от прямых запросов, secure_link проверяет
+# подпись и срок (формат nginx — md5 от "$secure_link_expires$uri <секрет>", см. sign_accel).
+# При X-Accel-Redirect nginx сам передаёт клиенту только ACCEL_KEPT_HEADERS; ключи, хэши и
+# Content-Encoding (ACCEL_FORWARDED_HEADERS) надо скопировать add_header, иначе лаунчер не расшифрует файл:
+#   location /protected_internal/ {
+#       internal;
+#       secure_link $arg_sig,$arg_expires;
+#       secure_link_md5 "$secure_link_expires$uri <DOWNLOAD_OFFLOAD_SECRET>";
+#       if ($secure_link = "")  { return 403; }
+#       if ($secure_link = "0") { return 410; }
+#       alias /opt/fpbooster/protected_builds/;
+#       etag off;
+#       add_header ETag $upstream_http_etag;
+#       add_header Content-Encoding $upstream_http_content_encoding;
+#       add_header Vary $upstream_http_vary;
+#       add_header X-Encryption-Key $upstream_http_x_encryption_key;
+#       add_header X-Decryption-Key $upstream_http_x_decryption_key;
+#       add_header X-Content-SHA256 $upstream_http_x_content_sha256;
+#       add_header X-Build-Hash $upstream_http_x_build_hash;
+#       add_header X-Patch-Format $upstream_http_x_patch_format;
+#       add_header X-Patch-From $upstream_http_x_patch_from;
+#       add_header Access-Control-Expose-Headers $upstream_http_access_control_expose_headers;
+#   }
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+from typing import Optional
+from urllib.parse import quote, urlsplit, parse_qs, unquote
+
+from cryptography.fernet import Fernet, InvalidToken
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import Response, RedirectResponse
+
+import artifacts
+
+OFFLOAD_MODE = os.getenv("DOWNLOAD_OFFLOAD", "none").strip().lower()
+OFFLOAD_EMULATE = os.getenv("DOWNLOAD_OFFLOAD_EMULATE", "0") == "1"
+OFFLOAD_TTL = int(os.getenv("DOWNLOAD_OFFLOAD_TTL", "60"))
+OFFLOAD_INTERNAL_PREFIX = os.getenv("DOWNLOAD_OFFLOAD_PREFIX", "/protected_internal").rstrip("/")
+OFFLOAD_BASE_URL = os.getenv("DOWNLOAD_OFFLOAD_BASE_URL", "/internal/builds").rstrip("/")
+# Общий для всех воркеров и фронта ключ подписи. Случайный ключ на процесс nginx и другие воркеры
+# не проверят — каждое скачивание получит 403, поэтому без ключа не стартуем
+OFFLOAD_SECRET = os.getenv("DOWNLOAD_OFFLOAD_SECRET", "").strip()
+if OFFLOAD_MODE != "none" and not OFFLOAD_SECRET:
+    raise RuntimeError("DOWNLOAD_OFFLOAD_SECRET is not set")
+
+# Заголовки, которые фронт должен выставить сам (длина/диапазон — по реальному файлу)
+_DROP_ON_OFFLOAD = {"content-length", "content-range", "accept-ranges"}
+# Заголовки тела: на пустом 302 им не место, они нужны только итоговому ответу
+_BODY_HEADERS = {"content-encoding", "content-disposition", "vary", "etag"}
+# Заголовки ответа приложения, которые nginx сохраняет при X-Accel-Redirect сам
+ACCEL_KEPT_HEADERS = {"content-type", "content-disposition", "accept-ranges", "set-cookie", "cache-control", "expires"}
+# ...и которые пример конфига выше копирует через add_header $upstream_http_*
+ACCEL_FORWARDED_HEADERS = {
+    "etag", "content-encoding", "vary", "x-encryption-key", "x-decryption-key", "x-content-sha256",
+    "x-build-hash", "x-patch-format", "x-patch-from", "access-control-expose-headers",
+}
+
+router = APIRouter(prefix="/internal/builds", tags=["Downloads"])
+
+# Шифр для заголовков в ссылках signed_url: ключ выводится из общего секрета
+_header_cipher = Fernet(base64.urlsafe_b64encode(
+    hashlib.sha256(f"offload-headers:{OFFLOAD_SECRET}".encode()).digest()
+)) if OFFLOAD_SECRET else None
+
+
+def sign(rel_path: str, expires: int) -> str:
+    mac = hmac.new(OFFLOAD_SECRET.encode(), f"{rel_path}:{expires}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(mac).rstrip(b"=").decode()
+
+
+def sign_accel(uri: str, expires: int) -> str:
+    """Подпись для nginx secure_link_md5: nginx умеет проверять только md5 от строки с секретом."""
+    digest = hashlib.md5(f"{expires}{uri} {OFFLOAD_SECRET}".encode()).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def verify(rel_path: str, expires: str, sig: str, signer=sign) -> bool:
+    try:
+        expires_at = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires_at < time.time():
+        return False
+    return hmac.compare_digest(signer(rel_path, expires_at), sig or "")
+
+
+def signed_query(rel: str, signer=sign) -> str:
+    expires = int(time.time()) + OFFLOAD_TTL
+    return f"expires={expires}&sig={signer(rel, expires)}"
+
+
+def seal_headers(headers: dict) -> str:
+    return _header_cipher.encrypt(json.dumps(headers).encode()).decode() if headers else ""
+
+
+def open_headers(token: str) -> dict:
+    if not token:
+        return {}
+    try:
+        return json.loads(_header_cipher.decrypt(token.encode(), ttl=OFFLOAD_TTL * 2))
+    except (InvalidToken, ValueError):
+        raise HTTPException(403, "Invalid download headers")
+
+
+def _resolve(rel: str):
+    """Артефакт по относительному пути: только то, что есть в манифесте (за пределы каталога не выйти)."""
+    return artifacts.manifest.lookup(rel)
+
+
+def offload_response(request: Request, artifact, headers: Optional[dict] = None) -> Response:
+    """
+    Ответ на скачивание с учётом DOWNLOAD_OFFLOAD. Совпавший If-None-Match отвечаем сами (304),
+    чтобы ETag оставался хэшем содержимого независимо от фронта.
+    """
+    headers = dict(headers or {})
+    if OFFLOAD_MODE == "none" or artifacts.etag_matches(request.headers.get("if-none-match"), artifact.etag):
+        return artifacts.artifact_response(request, artifact, headers=headers)
+
+    headers["ETag"] = artifact.etag
+    headers = {k: v for k, v in headers.items() if k.lower() not in _DROP_ON_OFFLOAD}
+    rel = artifacts.rel_path(artifact)
+
+    if OFFLOAD_MODE == "accel":
+        # nginx сверяет с $uri — уже раскодированным путём internal-location
+        uri = f"{OFFLOAD_INTERNAL_PREFIX}/{rel}"
+        headers["X-Accel-Redirect"] = f"{OFFLOAD_INTERNAL_PREFIX}/{quote(rel)}?{signed_query(uri, sign_accel)}"
+        headers["X-Accel-Buffering"] = "no"
+        return Response(status_code=200, media_type="application/octet-stream", headers=headers)
+
+    if OFFLOAD_MODE == "sendfile":
+        headers["X-Sendfile"] = artifact.path
+        return Response(status_code=200, media_type="application/octet-stream", headers=headers)
+
+    if OFFLOAD_MODE == "signed_url":
+        # Заголовки — в ссылке (см. шапку); на 302 остаются ключи и хэши для клиентов, читающих его сами
+        sealed = seal_headers({k: v for k, v in headers.items() if k.lower() != "etag"})
+        expires = int(time.time()) + OFFLOAD_TTL
+        url = f"{OFFLOAD_BASE_URL}/{quote(rel)}?expires={expires}&h={quote(sealed)}&sig={sign(f'{rel}:{sealed}', expires)}"
+        redirect_headers = {k: v for k, v in headers.items() if k.lower() not in _BODY_HEADERS}
+        return RedirectResponse(url, status_code=302, headers=redirect_headers)
+
+    return artifacts.artifact_response(request, artifact, headers=headers)
+
+
+async def accel_middleware(request: Request, call_next):
+    """
+    Локальная эмуляция nginx: выполняет X-Accel-Redirect сам, с проверкой подписи.
+    Заголовки пропускает так же, как nginx с примером конфига, — потерянный заголовок видно и локально.
+    """
+    response = await call_next(request)
+    target = response.headers.get("x-accel-redirect")
+    if not (OFFLOAD_EMULATE and target):
+        return response
+
+    parts = urlsplit(target)
+    query = parse_qs(parts.query)
+    rel = unquote(parts.path[len(OFFLOAD_INTERNAL_PREFIX) + 1:]) if parts.path.startswith(OFFLOAD_INTERNAL_PREFIX + "/") else ""
+    expires, sig = (query.get("expires") or [""])[0], (query.get("sig") or [""])[0]
+    if not rel or not verify(f"{OFFLOAD_INTERNAL_PREFIX}/{rel}", expires, sig, sign_accel):
+        return Response("Invalid offload signature", status_code=403)
+
+    artifact = _resolve(rel)
+    if artifact is None:
+        return Response("Not found", status_code=404)
+
+    passed = (ACCEL_KEPT_HEADERS | ACCEL_FORWARDED_HEADERS) - {"content-type", "etag", "accept-ranges"}
+    headers = {k: v for k, v in response.headers.items() if k.lower() in passed}
+    return artifacts.artifact_response(request, artifact, headers=headers)
+
+
+# --- API ---
+@router.get("/{rel:path}")
+async def signed_download(request: Request, rel: str, expires: str = "", h: str = "", sig: str = ""):
+    """Отдача по подписанной ссылке signed_url с заголовками исходного ответа (Content-Encoding, ключи)."""
+    if not verify(f"{rel}:{h}", expires, sig):
+        raise HTTPException(403, "Invalid or expired signature")
+    artifact = _resolve(rel)
+    if artifact is None:
+        raise HTTPException(404, "Not found")
+    return artifacts.artifact_response(request, artifact, headers=open_headers(h))
@@ -0,0 +1,169 @@
+# page_cache.py
+# Кэш готового HTML для анонимных посетителей публичных страниц (/, /buy, /eula...).
+# Для гостя страница не зависит ни от чего, кроме маршрута, поэтому рендерим
+# шаблон один раз на TTL и дальше отдаём байты из памяти с ETag/Last-Modified.
+# Кэш свой в каждом процессе: сброс из админки рассылается всем воркерам через
+# NOTIFY page_cache_invalidate (listen_worker, как в group_catalog.py).
+import os
+import time
+import asyncio
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Optional
+
+import asyncpg
+from fastapi import APIRouter, Request, Depends
+from fastapi.responses import Response
+
+from guards import admin_guard_ui
+
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "60"))
+# payload — маршрут или пустая строка (весь кэш)
+NOTIFY_CHANNEL = "page_cache_invalidate"
+
+router = APIRouter(prefix="/admin/page-cache", tags=["Admin Page Cache"])
+
+
+class CachedPage:
+    __slots__ = ("body", "media_type", "etag", "last_modified", "expires_at")
+
+    def __init__(self, body: bytes, media_type: str, ttl: int):
+        self.body = body
+        self.media_type = media_type
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self.expires_at = time.monotonic() + ttl
+
+
+class PageCache:
+    def __init__(self, default_ttl: int = PAGE_CACHE_TTL):
+        self.default_ttl = default_ttl
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[CachedPage]:
+        entry = self.entries.get(key)
+        if entry and entry.expires_at > time.monotonic():
+            return entry
+        return None
+
+    def put(self, key: str, body: bytes, media_type: str, ttl: Optional[int] = None) -> CachedPage:
+        entry = CachedPage(body, media_type, ttl if ttl is not None else self.default_ttl)
+        self.entries[key] = entry
+        return entry
+
+    def invalidate(self, route: Optional[str] = None) -> int:
+        """Сбросить один маршрут (все варианты) или весь кэш."""
+        if route is None:
+            dropped = len(self.entries)
+            self.entries.clear()
+            return dropped
+        keys = [k for k in self.entries if k.split("|", 1)[0] == route]
+        for k in keys:
+            del self.entries[k]
+        return len(keys)
+
+    def stats(self) -> dict:
+        return {"entries": sorted(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+# Один кэш на процесс
+page_cache = PageCache()
+
+
+def is_anonymous(request: Request) -> bool:
+    """Гость = нет ни куки сессии, ни Authorization. БД не трогаем."""
+    token = request.cookies.get("user_auth")
+    if token and str(token).lower() not in ["null", "undefined", "none", ""]:
+        return False
+    return not request.headers.get("Authorization")
+
+
+def cache_key(route: str, anonymous: bool = True) -> str:
+    return f"{route}|{'anon' if anonymous else 'user'}"
+
+
+def _not_modified(request: Request, entry: CachedPage) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm:
+        return entry.etag in [t.strip() for t in inm.split(",")] or inm.strip() == "*"
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            return parsedate_to_datetime(ims) >= entry.last_modified
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cached_response(request: Request, route: str, render: Callable[[], Response], ttl: Optional[int] = None) -> Response:
+    """
+    Отдаёт страницу гостя из кэша; при промахе вызывает render() (обычный
+    TemplateResponse) и кладёт результат в кэш. Кэшируются только ответы 200.
+    """
+    key = cache_key(route, anonymous=True)
+    entry = page_cache.get(key)
+    if entry:
+        page_cache.hits += 1
+    else:
+        page_cache.misses += 1
+        resp = render()
+        if resp.status_code != 200:
+            return resp
+        entry = page_cache.put(key, resp.body, resp.media_type or "text/html", ttl)
+
+    headers = {
+        "ETag": entry.etag,
+        "Last-Modified": format_datetime(entry.last_modified, usegmt=True),
+        # Вариант страницы зависит от куки сессии — общий прокси не должен путать
+        "Cache-Control": "no-cache",
+        "Vary": "Cookie",
+    }
+    if _not_modified(request, entry):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+
+
+def _on_notify(conn, pid, channel, payload):
+    dropped = page_cache.invalidate(payload or None)
+    print(f"[PageCache] invalidated {payload or '*'}: {dropped} entries", flush=True)
+
+
+# --- WORKER ---
+async def listen_worker(dsn: str):
+    """
+    LISTEN page_cache_invalidate на отдельном соединении. После обрыва сбрасываем весь кэш:
+    уведомления за время без соединения потеряны, а страницы в худшем случае перерендерятся.
+    """
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(dsn=dsn)
+            await conn.add_listener(NOTIFY_CHANNEL, _on_notify)
+            page_cache.invalidate()
+            while not conn.is_closed():
+                await asyncio.sleep(60)
+                # Проверяем, что соединение живо
+                await conn.execute("SELECT 1")
+        except Exception as e:
+            print(f"[PageCache] listener error: {e}", flush=True)
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(5)
+
+
+# --- API ---
+@router.get("/stats")
+async def page_cache_stats(_=Depends(admin_guard_ui)):
+    return page_cache.stats()
+
+
+@router.post("/invalidate")
+async def page_cache_invalidate(request: Request, route: Optional[str] = None, _=Depends(admin_guard_ui)):
+    """Сброс во всех воркерах (NOTIFY); dropped — сколько записей сброшено в этом процессе."""
+    dropped = page_cache.invalidate(route)
+    await request.app.state.pool.execute("SELECT pg_notify($1, $2)", NOTIFY_CHANNEL, route or "")
+    return {"dropped": dropped, "broadcast": True}
@@ -0,0 +1,64 @@
+# pagination.py
+# Keyset-пагинация для списков админки: курсор = (created_at, id) последней/первой
+# строки страницы, упакованный в base64 для query-строки.
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def clamp_page_size(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Битый курсор = нет курсора (первая страница), без 500."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_clause(direction: str, first_param: int, alias: str = "") -> str:
+    """
+    Условие для страницы в порядке (created_at DESC, id DESC).
+    direction="next" — строки старше курсора, "prev" — новее.
+    """
+    col = f"{alias}." if alias else ""
+    op = ">" if direction == "prev" else "<"
+    return f"({col}created_at, {col}id) {op} (${first_param}, ${first_param + 1})"
+
+
+def build_page(rows: list, limit: int, direction: str, has_cursor: bool) -> dict:
+    """
+    rows — выборка из limit + 1 строк в порядке запроса
+    (для prev — по возрастанию). Возвращает строки страницы по убыванию и курсоры.
+    """
+    has_more = len(rows) > limit
+    rows = list(rows[:limit])
+    if direction == "prev":
+        rows.reverse()
+
+    if direction == "prev":
+        has_next, has_prev = has_cursor, has_more
+    else:
+        has_next, has_prev = has_more, has_cursor
+
+    return {
+        "rows": rows,
+        "next_cursor": encode_cursor(rows[-1]["created_at"], rows[-1]["id"]) if rows and has_next else None,
+        "prev_cursor": encode_cursor(rows[0]["created_at"], rows[0]["id"]) if rows and has_prev else None,
+    }
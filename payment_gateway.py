@@ -0,0 +1,110 @@
+# payment_gateway.py
+# Общий HTTP-клиент к PayPalych (pal24.pro): один пул соединений на процесс,
+# повторы на сетевых сбоях и метрики задержек по каждому вызову.
+import os
+import time
+import random
+import asyncio
+from typing import Optional
+
+import httpx
+
+# ===== Конфиг =====
+# Базовый URL можно подменить на локальную заглушку (см. scripts/bench_gateway.py)
+PAYPALYCH_API_URL = os.getenv("PAYPALYCH_API_URL", "https://pal24.pro").rstrip("/")
+GATEWAY_TIMEOUT = float(os.getenv("GATEWAY_TIMEOUT", "20"))
+GATEWAY_MAX_RETRIES = int(os.getenv("GATEWAY_MAX_RETRIES", "2"))
+GATEWAY_MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "20"))
+
+# HTTP/2 включаем только если установлен пакет h2 (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Ответы, после которых запрос безопасно повторить: шлюз его не обработал.
+# 502/504 сюда не входят — счёт мог успеть создаться.
+RETRY_STATUSES = {429, 503}
+
+# Ошибки, при которых запрос гарантированно не дошёл до шлюза
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class GatewayMetrics:
+    """Простые счётчики задержек по имени вызова (bill_create и т.д.)."""
+
+    def __init__(self):
+        self.calls = {}
+
+    def observe(self, name: str, seconds: float, ok: bool, retries: int):
+        m = self.calls.setdefault(name, {
+            "count": 0, "errors": 0, "retries": 0,
+            "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0,
+        })
+        ms = seconds * 1000
+        m["count"] += 1
+        m["retries"] += retries
+        m["total_ms"] += ms
+        m["last_ms"] = ms
+        m["max_ms"] = max(m["max_ms"], ms)
+        if not ok:
+            m["errors"] += 1
+
+    def snapshot(self) -> dict:
+        out = {}
+        for name, m in self.calls.items():
+            out[name] = dict(m, avg_ms=round(m["total_ms"] / m["count"], 2) if m["count"] else 0.0)
+        return out
+
+
+class PaymentGateway:
+    """
+    Клиент создаётся один раз на старте приложения (app.state.gateway)
+    и закрывается на shutdown. TLS-соединение к шлюзу переиспользуется.
+    """
+
+    def __init__(self, base_url: str = PAYPALYCH_API_URL, api_token: Optional[str] = None,
+                 timeout: float = GATEWAY_TIMEOUT, max_retries: int = GATEWAY_MAX_RETRIES):
+        self.base_url = base_url.rstrip("/")
+        self.api_token = api_token
+        self.max_retries = max_retries
+        self.metrics = GatewayMetrics()
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=timeout,
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=GATEWAY_MAX_CONNECTIONS,
+                max_keepalive_connections=GATEWAY_MAX_CONNECTIONS,
+                keepalive_expiry=60,
+            ),
+        )
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def _post(self, name: str, path: str, data: dict) -> httpx.Response:
+        headers = {"Authorization": f"Bearer {self.api_token}"}
+        started = time.monotonic()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    r = await self.client.post(path, headers=headers, data=data)
+                    if r.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                        self.metrics.observe(name, time.monotonic() - started, r.status_code < 400, attempt)
+                        return r
+                except RETRY_EXCEPTIONS:
+                    if attempt >= self.max_retries:
+                        raise
+                attempt += 1
+                # Экспоненциальная пауза с full jitter: 0..(0.2 * 2^attempt) сек
+                await asyncio.sleep(random.uniform(0, 0.2 * (2 ** attempt)))
+        except Exception:
+            self.metrics.observe(name, time.monotonic() - started, False, attempt)
+            raise
+
+    async def create_bill(self, payload: dict) -> httpx.Response:
+        return await self._post("bill_create", "/api/v1/bill/create", payload)
+
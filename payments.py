@@ -1,25 +1,33 @@
 # payments.py
 import os
 import hashlib
+import json
 import time
-from datetime import date, timedelta, datetime
+import asyncio
 
-import httpx
-from fastapi import APIRouter, Request, Query, HTTPException
+from fastapi import APIRouter, Request, Query, HTTPException, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
 
 # Импортируем PLANS
 from buy import PLANS
 from auth.guards import get_current_user
+from guards import admin_guard_ui
+from group_catalog import catalog
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 
 # ===== Конфиг PayPalych (pal24.pro) =====
 SHOP_ID = os.getenv("PAYPALYCH_SHOP_ID")
 API_TOKEN = os.getenv("PAYPALYCH_TOKEN")
-BILL_CREATE_URL = "https://pal24.pro/api/v1/bill/create"
+# HTTP-клиент к шлюзу живёт в app.state.gateway (payment_gateway.py)
+
+# ===== Конфиг outbox-воркера =====
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+# Строка в processing дольше этого — воркер умер, возвращаем в очередь
+OUTBOX_STALE_SECONDS = int(os.getenv("OUTBOX_STALE_SECONDS", "300"))
 
 def md5_upper(s: str) -> str:
     return hashlib.md5(s.encode("utf-8")).hexdigest().upper()
@@ -109,14 +117,11 @@ async def payment_start(request: Request, plan: str = Query(...), method: str =
         "name": "Платёж FPBooster",
     }
 
-    headers = {"Authorization": f"Bearer {API_TOKEN}"}
-
-    async with httpx.AsyncClient(timeout=20) as client:
-        r = await client.post(BILL_CREATE_URL, headers=headers, data=payload)
-        if r.status_code == 401:
-            return {"ok": False, "error": "Ошибка авторизации в PayPalych (401)"}
-        r.raise_for_status()
-        data = r.json()
+    r = await request.app.state.gateway.create_bill(payload)
+    if r.status_code == 401:
+        return {"ok": False, "error": "Ошибка авторизации в PayPalych (401)"}
+    r.raise_for_status()
+    data = r.json()
 
     link_page_url = data.get("link_page_url")
     success = str(data.get("success", "")).lower() == "true"
@@ -127,15 +132,156 @@ async def payment_start(request: Request, plan: str = Query(...), method: str =
         return {"ok": False, "error": data}
 
 
+# ===== Выдача товара (внутри транзакции) =====
+
+# Маппинг типа плана -> ключ лицензии для лаунчера
+LICENSE_TYPE_MAP = {
+    "license": "Default",
+    "license_alpha": "Alpha",
+    "license_plus": "Plus"
+}
+
+# Вся выдача одним запросом (один round-trip, пока держатся блокировки):
+#   cur  - текущая лицензия (блокируем строку)
+#   calc - новая дата: продление от текущей, если не истекла, иначе от сегодня;
+#          "вечная" (> 10000 дней) всегда = сегодня + 36500
+#   upd/ins - licenses (UPDATE если есть, иначе INSERT с username из users)
+#   grp  - upsert в user_groups (если группы нет — $4 IS NULL — ничего)
+#   pur  - запись в purchases
+# $1 uid, $2 days, $3 license_key, $4 group_id (из group_catalog), $5 plan, $6 amount, $7 currency
+FULFILL_SQL = """
+    WITH cur AS (
+        SELECT expires FROM licenses WHERE user_uid = $1::uuid FOR UPDATE
+    ),
+    calc AS (
+        SELECT CASE
+                 WHEN $2::int > 10000 THEN CURRENT_DATE + 36500
+                 WHEN (SELECT MAX(expires) FROM cur) > CURRENT_DATE THEN (SELECT MAX(expires) FROM cur) + $2::int
+                 ELSE CURRENT_DATE + $2::int
+               END AS new_expires
+    ),
+    upd AS (
+        UPDATE licenses l
+        SET status = 'active', expires = calc.new_expires, license_key = $3
+        FROM calc
+        WHERE l.user_uid = $1::uuid
+        RETURNING l.user_uid
+    ),
+    ins AS (
+        INSERT INTO licenses (user_uid, user_name, status, expires, created_at, duration_days, license_key)
+        SELECT $1::uuid,
+               COALESCE((SELECT username FROM users WHERE uid = $1::uuid), 'Unknown'),
+               'active', calc.new_expires, NOW(), $2::int, $3
+        FROM calc
+        WHERE NOT EXISTS (SELECT 1 FROM cur)
+        RETURNING user_uid
+    ),
+    grp AS (
+        INSERT INTO user_groups (user_uid, group_id, granted_at, expires_at, is_active, granted_by)
+        SELECT $1::uuid, $4::int, NOW(), calc.new_expires + TIME '23:59:59', TRUE, NULL
+        FROM calc
+        WHERE $4::int IS NOT NULL
+        ON CONFLICT (user_uid, group_id)
+        DO UPDATE SET expires_at = EXCLUDED.expires_at, is_active = TRUE, granted_at = NOW()
+        RETURNING 1
+    ),
+    pur AS (
+        INSERT INTO purchases (user_uid, plan, amount, currency, source)
+        VALUES ($1::uuid, $5, $6, $7, 'payment')
+        RETURNING 1
+    )
+    SELECT new_expires FROM calc
+"""
+
+
+async def fulfill_payment(conn, uid: str, plan: str, plan_data: dict, out_sum: str, currency_in: str) -> str:
+    """
+    Выдает лицензию, группу и пишет покупку. Вызывать внутри conn.transaction().
+    Возвращает новую дату окончания (или "HWID Reset").
+    """
+    # --- A. СБРОС HWID ---
+    if plan == "hwid_reset":
+        await conn.execute("UPDATE licenses SET hwid = NULL WHERE user_uid=$1", uid)
+        await conn.execute(
+            """
+            INSERT INTO purchases (user_uid, plan, amount, currency, source)
+            VALUES ($1, $2, $3, $4, 'payment')
+            """,
+            uid, plan, out_sum, currency_in
+        )
+        return "HWID Reset"
+
+    # --- B. ВЫДАЧА ЛИЦЕНЗИИ, ГРУППЫ И ЛОГ ПОКУПКИ (один запрос) ---
+    group = await catalog.resolve_slug(plan_data.get("group_slug"), conn)
+    new_expires_date = await conn.fetchval(
+        FULFILL_SQL,
+        uid,
+        plan_data.get("days", 30),
+        LICENSE_TYPE_MAP.get(plan_data.get("type"), "Default"),
+        group["id"] if group else None,
+        plan, out_sum, currency_in
+    )
+    return str(new_expires_date)
+
+
+# ===== Журнал обработанных счетов (идемпотентность по InvId) =====
+
+async def get_processed_invoice(conn, inv_id: str):
+    """Результат уже обработанного счёта или None. Один поиск по PK."""
+    stored = await conn.fetchval("SELECT result FROM processed_invoices WHERE inv_id=$1", inv_id)
+    return json.loads(stored) if stored else None
+
+
+async def process_invoice(pool, inv_id: str, uid: str, plan: str, plan_data: dict, out_sum: str, currency_in: str) -> dict:
+    """
+    Выдача товара ровно один раз на InvId.
+    Повторный postback отдаёт сохранённый результат; параллельные дубли
+    сериализуются на advisory lock и тоже получают сохранённый результат.
+    """
+    async with pool.acquire() as conn:
+        stored = await get_processed_invoice(conn, inv_id)
+        if stored:
+            return stored
+
+        async with conn.transaction():
+            # Блокировка живёт до конца транзакции
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('invoice:' || $1))", inv_id)
+
+            # Пока ждали блокировку, дубль мог всё сделать
+            stored = await get_processed_invoice(conn, inv_id)
+            if stored:
+                return stored
+
+            new_expires = await fulfill_payment(conn, uid, plan, plan_data, out_sum, currency_in)
+
+            result = {
+                "ok": True,
+                "status": "SUCCESS",
+                "uid": uid,
+                "plan": plan,
+                "expires": new_expires,
+                "inv_id": inv_id
+            }
+            await conn.execute(
+                """
+                INSERT INTO processed_invoices (inv_id, user_uid, plan, amount, currency, result)
+                VALUES ($1, $2, $3, $4, $5, $6::jsonb)
+                """,
+                inv_id, uid, plan, out_sum, currency_in, json.dumps(result)
+            )
+    return result
+
+
 # ===== Postback: Обработка результата =====
 
 @router.post("/payment/result")
 async def payment_result(request: Request):
     """
-    Основная логика выдачи товара.
+    Приём postback'а от шлюза.
     1. Проверяет подпись.
-    2. Определяет тариф и группу.
-    3. Выдает лицензию И группу в одной транзакции.
+    2. Определяет тариф.
+    3. Кладёт счёт в payment_outbox и сразу отвечает шлюзу.
+    Выдачу делает outbox_worker (один раз на InvId, см. process_invoice).
     """
     data = await request.form()
 
@@ -165,117 +311,166 @@ async def payment_result(request: Request):
         # Если план не найден, но оплата прошла - логируем ошибку (или просто OK, чтобы шлюз не долбил)
         return {"ok": True, "status": "UNKNOWN_PLAN"}
 
-    days = plan_data.get("days", 30)
-    group_slug = plan_data.get("group_slug") # Получаем slug группы из нового конфига
-
-    # 3. Обработка успешной оплаты
+    # 3. Успешная оплата -> outbox (дубль InvId просто игнорируется)
     if status == "SUCCESS" and uid:
-        async with request.app.state.pool.acquire() as conn:
-            async with conn.transaction():
-                
-                # --- A. СБРОС HWID ---
-                if plan == "hwid_reset":
-                    await conn.execute("UPDATE licenses SET hwid = NULL WHERE user_uid=$1", uid)
-                    new_expires = "HWID Reset"
-
-                # --- B. ВЫДАЧА ЛИЦЕНЗИИ И ГРУППЫ ---
-                else:
-                    # 1. Расчет новой даты окончания
-                    # Смотрим текущую лицензию в таблице licenses (она главная для лаунчера)
-                    row = await conn.fetchrow("SELECT expires FROM licenses WHERE user_uid=$1", uid)
-                    
-                    today = date.today()
-                    current_expires = row["expires"] if row else None
-                    
-                    # Логика продления: если лицензия активна и не истекла, добавляем к ней. Иначе - от сегодня.
-                    if current_expires and current_expires > today:
-                        new_expires_date = current_expires + timedelta(days=days)
-                    else:
-                        new_expires_date = today + timedelta(days=days)
-                    
-                    # Обработка "Вечной" лицензии (36500 дней)
-                    if days > 10000:
-                         # Если покупаем вечную, то ставим вечную дату, игнорируя старую
-                         new_expires_date = today + timedelta(days=36500)
-
-                    # 2. Обновляем таблицу LICENSES (для лаунчера)
-                    # Определяем ключ лицензии на основе типа плана (маппинг типов)
-                    license_type_map = {
-                        "license": "Default",
-                        "license_alpha": "Alpha",
-                        "license_plus": "Plus"
-                    }
-                    license_key_val = license_type_map.get(plan_data.get("type"), "Default")
-
-                    existing_lic = await conn.fetchrow("SELECT user_uid FROM licenses WHERE user_uid=$1", uid)
-                    if existing_lic:
-                        await conn.execute(
-                            """
-                            UPDATE licenses
-                            SET status='active', expires=$1, license_key=$2
-                            WHERE user_uid=$3
-                            """,
-                            new_expires_date, license_key_val, uid
-                        )
-                    else:
-                        # Если вдруг записи нет (новый юзер), нужно получить username
-                        user_info = await conn.fetchrow("SELECT username FROM users WHERE uid=$1", uid)
-                        u_name = user_info["username"] if user_info else "Unknown"
-                        await conn.execute(
-                            """
-                            INSERT INTO licenses (user_uid, user_name, status, expires, created_at, duration_days, license_key)
-                            VALUES ($1, $2, 'active', $3, NOW(), $4, $5)
-                            """,
-                            uid, u_name, new_expires_date, days, license_key_val
-                        )
-
-                    # 3. Обновляем таблицу USER_GROUPS (Новая система!)
-                    if group_slug:
-                        # Получаем ID группы
-                        group_row = await conn.fetchrow("SELECT id FROM groups WHERE slug=$1", group_slug)
-                        if group_row:
-                            group_id = group_row["id"]
-                            
-                            # Конвертируем date в datetime для user_groups (там timestamp)
-                            expires_ts = datetime(
-                                new_expires_date.year, 
-                                new_expires_date.month, 
-                                new_expires_date.day, 
-                                23, 59, 59
-                            )
-                            
-                            # Upsert в user_groups
-                            await conn.execute(
-                                """
-                                INSERT INTO user_groups (user_uid, group_id, granted_at, expires_at, is_active, granted_by)
-                                VALUES ($1, $2, NOW(), $3, TRUE, NULL)
-                                ON CONFLICT (user_uid, group_id) 
-                                DO UPDATE SET expires_at = $3, is_active = TRUE, granted_at = NOW()
-                                """,
-                                uid, group_id, expires_ts
-                            )
-
-                    new_expires = str(new_expires_date)
-
-                # --- C. ЛОГИРОВАНИЕ ПОКУПКИ ---
-                await conn.execute(
-                    """
-                    INSERT INTO purchases (user_uid, plan, amount, currency, source)
-                    VALUES ($1, $2, $3, $4, 'payment')
-                    """,
-                    uid, plan, out_sum, currency_in
-                )
-
-        return {
-            "ok": True,
-            "status": "SUCCESS",
+        payload = {
             "uid": uid,
             "plan": plan,
-            "expires": new_expires,
-            "inv_id": inv_id
+            "out_sum": out_sum,
+            "currency_in": currency_in,
         }
+        async with request.app.state.pool.acquire() as conn:
+            await conn.execute(
+                """
+                INSERT INTO payment_outbox (inv_id, payload)
+                VALUES ($1, $2::jsonb)
+                ON CONFLICT (inv_id) DO NOTHING
+                """,
+                inv_id, json.dumps(payload)
+            )
+        # Будим воркер этого процесса, не дожидаясь следующего опроса
+        wakeup = getattr(request.app.state, "outbox_wakeup", None)
+        if wakeup: wakeup.set()
+
+        return {"ok": True, "status": "ACCEPTED", "uid": uid, "plan": plan, "inv_id": inv_id}
 
     elif status == "FAIL":
         return {"ok": False, "status": "FAIL", "inv_id": inv_id}
 
     return {"ok": False, "status": status or "UNKNOWN", "inv_id": inv_id}
+
+
+# ===== Outbox-воркер =====
+
+def _retry_delay(attempts: int) -> int:
+    """Пауза перед следующей попыткой: 10с, 20с, 40с ... но не больше часа."""
+    return min(10 * (2 ** max(attempts - 1, 0)), 3600)
+
+
+async def claim_outbox_batch(pool, limit: int):
+    """Забирает пачку pending-строк (SKIP LOCKED — несколько воркеров не мешают друг другу)."""
+    async with pool.acquire() as conn:
+        # Возвращаем в очередь строки, зависшие в processing (воркер упал посреди выдачи)
+        await conn.execute(
+            """
+            UPDATE payment_outbox SET status = 'pending', locked_at = NULL
+            WHERE status = 'processing' AND locked_at < NOW() - make_interval(secs => $1)
+            """,
+            OUTBOX_STALE_SECONDS
+        )
+        return await conn.fetch(
+            """
+            UPDATE payment_outbox o
+            SET status = 'processing', locked_at = NOW(), attempts = o.attempts + 1
+            WHERE o.id IN (
+                SELECT id FROM payment_outbox
+                WHERE status = 'pending' AND next_attempt_at <= NOW()
+                ORDER BY next_attempt_at, id
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING o.id, o.inv_id, o.payload, o.attempts
+            """,
+            limit
+        )
+
+
+async def handle_outbox_row(pool, row):
+    payload = json.loads(row["payload"]) if isinstance(row["payload"], str) else row["payload"]
+    try:
+        plan = payload["plan"]
+        plan_data = PLANS.get(plan)
+        if not plan_data:
+            raise ValueError(f"Unknown plan: {plan}")
+
+        await process_invoice(pool, row["inv_id"], payload["uid"], plan, plan_data,
+                              payload["out_sum"], payload["currency_in"])
+
+        async with pool.acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE payment_outbox
+                SET status = 'done', processed_at = NOW(), locked_at = NULL, last_error = NULL
+                WHERE id = $1
+                """,
+                row["id"]
+            )
+    except Exception as e:
+        dead = row["attempts"] >= OUTBOX_MAX_ATTEMPTS
+        print(f"[Outbox] InvId {row['inv_id']} attempt {row['attempts']} failed{' (DEAD)' if dead else ''}: {e}", flush=True)
+        async with pool.acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE payment_outbox
+                SET status = $2,
+                    locked_at = NULL,
+                    last_error = $3,
+                    next_attempt_at = NOW() + make_interval(secs => $4)
+                WHERE id = $1
+                """,
+                row["id"], "dead" if dead else "pending", str(e)[:500], _retry_delay(row["attempts"])
+            )
+
+
+async def outbox_worker(app):
+    await asyncio.sleep(2)
+    print(">>> [Outbox] WORKER STARTED", flush=True)
+    app.state.outbox_wakeup = asyncio.Event()
+
+    while True:
+        try:
+            if not hasattr(app.state, 'pool'): await asyncio.sleep(2); continue
+            pool = app.state.pool
+
+            rows = await claim_outbox_batch(pool, OUTBOX_BATCH_SIZE)
+            for row in rows:
+                await handle_outbox_row(pool, row)
+
+            # Полная пачка — сразу берём следующую
+            if len(rows) >= OUTBOX_BATCH_SIZE:
+                continue
+
+            app.state.outbox_wakeup.clear()
+            try:
+                await asyncio.wait_for(app.state.outbox_wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+        except Exception as e:
+            print(f"[Outbox] error: {e}", flush=True)
+            await asyncio.sleep(5)
+
+
+# ===== Админка: состояние outbox и ручной повтор =====
+
+@router.get("/admin/payments/outbox")
+async def outbox_status(request: Request, _=Depends(admin_guard_ui)):
+    async with request.app.state.pool.acquire() as conn:
+        counts = await conn.fetch("SELECT status, COUNT(*) AS cnt FROM payment_outbox GROUP BY status")
+        dead = await conn.fetch(
+            """
+            SELECT id, inv_id, payload, attempts, last_error, created_at
+            FROM payment_outbox WHERE status = 'dead'
+            ORDER BY id DESC LIMIT 100
+            """
+        )
+    return {
+        "counts": {r["status"]: r["cnt"] for r in counts},
+        "dead": [dict(r, payload=json.loads(r["payload"]) if isinstance(r["payload"], str) else r["payload"]) for r in dead],
+    }
+
+
+@router.post("/admin/payments/outbox/{outbox_id}/retry")
+async def outbox_retry(request: Request, outbox_id: int, _=Depends(admin_guard_ui)):
+    async with request.app.state.pool.acquire() as conn:
+        updated = await conn.fetchval(
+            """
+            UPDATE payment_outbox
+            SET status = 'pending', attempts = 0, next_attempt_at = NOW(), last_error = NULL
+            WHERE id = $1 AND status = 'dead'
+            RETURNING id
+            """,
+            outbox_id
+        )
+    if not updated:
+        raise HTTPException(404, "Outbox row not found or not dead")
+    return {"ok": True, "id": updated}
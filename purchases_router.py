@@ -1,13 +1,12 @@
 # purchases_router.py
 from fastapi import APIRouter, Request, Depends
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
 
 # Import the raw guard and wrap it for Depends
 from auth.guards import get_current_user as get_current_user_raw
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 
 async def current_user(request: Request):
     # wrapper so Depends doesn't look for "app" param
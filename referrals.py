@@ -2,7 +2,7 @@
 
 from fastapi import APIRouter, Request, Form, status, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
 
 from guards import admin_guard_ui  # общий guard без циклических импортов
 
@@ -11,7 +11,6 @@ from dateutil.relativedelta import relativedelta
 
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 
 # Обёртка для Depends: берём токен из app.state, а не из query
 def guard(request: Request):
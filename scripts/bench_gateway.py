@@ -0,0 +1,101 @@
+# scripts/bench_gateway.py
+# Бенчмарк клиента платёжного шлюза против локальной заглушки PayPalych.
+#
+#   python scripts/bench_gateway.py --requests 500 --concurrency 20
+#
+# Сравнивает старую схему (новый httpx.AsyncClient на каждый счёт)
+# с общим PaymentGateway из payment_gateway.py.
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+import httpx
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from payment_gateway import PaymentGateway  # noqa: E402
+
+
+async def _bill_create(request: web.Request):
+    data = await request.post()
+    # Имитация времени обработки на стороне шлюза
+    await asyncio.sleep(float(request.app["delay"]))
+    return web.json_response({
+        "success": "true",
+        "bill_id": data.get("order_id"),
+        "link_page_url": "https://pal24.pro/link/standin",
+    })
+
+
+async def start_standin(port: int, delay: float) -> web.AppRunner:
+    """Поднимает заглушку POST /api/v1/bill/create на 127.0.0.1."""
+    app = web.Application()
+    app["delay"] = delay
+    app.router.add_post("/api/v1/bill/create", _bill_create)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+def _payload(i: int) -> dict:
+    return {"amount": 199, "order_id": f"bench_{i}", "shop_id": "bench", "currency_in": "RUB"}
+
+
+async def _run(n: int, concurrency: int, call) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            r = await call(_payload(i))
+            r.raise_for_status()
+
+    started = time.monotonic()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return time.monotonic() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.005, help="задержка заглушки, сек")
+    parser.add_argument("--url", default=None, help="внешний стенд вместо встроенной заглушки")
+    args = parser.parse_args()
+
+    runner = None
+    base_url = args.url
+    if not base_url:
+        runner = await start_standin(args.port, args.delay)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        # 1. Старая схема: клиент на каждый запрос
+        async def per_request_client(payload):
+            async with httpx.AsyncClient(timeout=20) as client:
+                return await client.post(f"{base_url}/api/v1/bill/create", data=payload)
+
+        t_old = await _run(args.requests, args.concurrency, per_request_client)
+
+        # 2. Общий клиент с пулом
+        gateway = PaymentGateway(base_url=base_url, api_token="bench")
+        try:
+            t_new = await _run(args.requests, args.concurrency, gateway.create_bill)
+            metrics = gateway.metrics.snapshot()
+        finally:
+            await gateway.close()
+    finally:
+        if runner:
+            await runner.cleanup()
+
+    print(f"target:             {base_url}")
+    print(f"per-request client: {t_old:.3f}s ({args.requests / t_old:.0f} req/s)")
+    print(f"pooled gateway:     {t_new:.3f}s ({args.requests / t_new:.0f} req/s)")
+    print(f"gateway metrics:    {metrics}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
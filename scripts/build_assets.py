@@ -0,0 +1,147 @@
+# scripts/build_assets.py
+# Сборка статики с отпечатками: static/, templates_css/, JavaScript/ -> static_build.builds/<время>/,
+# затем static_build (симлинк) атомарно переключается на новую сборку.
+#
+#   python scripts/build_assets.py
+#
+# Для каждого файла: имя.<хэш>.ext, рядом .gz и .br (если установлен brotli) для текстовых типов,
+# в CSS ссылки url('/static/...') переписываются на версии с хэшем.
+# static_build/manifest.json читает assets.py (asset_url в шаблонах). Запускать при деплое:
+# воркеры подхватят новую сборку сами, а ASSETS_KEEP_BUILDS предыдущих остаются доступны по старым URL.
+# Перед этим scripts/build_images.py готовит WebP/AVIF-варианты картинок (images.json, srcset).
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import shutil
+import hashlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from assets import ASSETS_DIR, ASSETS_BUILDS_DIR, ASSETS_PREFIX, MANIFEST_NAME, IMAGES_MANIFEST  # noqa: E402
+import build_images  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# URL-префикс -> каталог исходников
+SOURCES = {
+    "/static": "static",
+    "/templates_css": "templates_css",
+    "/JavaScript": "JavaScript",
+}
+COMPRESSIBLE = {".css", ".js", ".svg", ".ico", ".json", ".txt", ".html", ".map"}
+# Сжатый вариант пишем, только если он меньше исходника хотя бы на 5%
+MIN_GAIN = 0.95
+HASH_LEN = 10
+# Сколько сборок хранить, включая текущую (на старые ссылаются закэшированные страницы)
+KEEP_BUILDS = int(os.getenv("ASSETS_KEEP_BUILDS", "3"))
+
+_CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)(/(?:static|templates_css|JavaScript)/[^'")?#]+)([^'")]*)\1\s*\)""")
+
+
+def _collect() -> list:
+    """(url, абсолютный путь) всех исходных файлов; CSS в конце — им нужны уже готовые картинки."""
+    files = []
+    for prefix, directory in SOURCES.items():
+        base = os.path.join(ROOT, directory)
+        for dirpath, _, names in os.walk(base):
+            for name in sorted(names):
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, base).replace(os.sep, "/")
+                files.append((f"{prefix}/{rel}", path))
+    return sorted(files, key=lambda f: f[0].endswith(".css"))
+
+
+def _rewrite_css(text: str, manifest: dict) -> str:
+    def repl(m):
+        quote, url, suffix = m.group(1), m.group(2), m.group(3)
+        return f"url({quote}{manifest.get(url, url)}{suffix}{quote})"
+    return _CSS_URL_RE.sub(repl, text)
+
+
+def _write_variants(path: str, data: bytes) -> list:
+    made = []
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data) * MIN_GAIN:
+        with open(path + ".gz", "wb") as f:
+            f.write(gz)
+        made.append("gz")
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data) * MIN_GAIN:
+            with open(path + ".br", "wb") as f:
+                f.write(br)
+            made.append("br")
+    return made
+
+
+def _activate(link: str, target: str):
+    """Переключает симлинк link на target одной операцией rename — воркеры видят либо старую, либо новую сборку."""
+    builds_root = os.path.dirname(target)
+    if os.path.isdir(link) and not os.path.islink(link):
+        # Каталог от сборки до симлинков: сохраняем как самую старую сборку
+        os.replace(link, os.path.join(builds_root, "0-legacy"))
+    tmp_link = link + ".tmp"
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(os.path.relpath(target, os.path.dirname(link)), tmp_link, target_is_directory=True)
+    os.replace(tmp_link, link)
+
+
+def _prune(builds_root: str, keep: int):
+    names = sorted((n for n in os.listdir(builds_root) if not n.endswith(".tmp")), reverse=True)
+    for name in names[keep:]:
+        shutil.rmtree(os.path.join(builds_root, name), ignore_errors=True)
+
+
+def build() -> dict:
+    out_root = os.path.join(ROOT, ASSETS_DIR)
+    builds_root = os.path.join(ROOT, ASSETS_BUILDS_DIR)
+    build_root = os.path.join(builds_root, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+    tmp_root = build_root + ".tmp"
+    shutil.rmtree(tmp_root, ignore_errors=True)
+    os.makedirs(tmp_root)
+
+    images = build_images.build(tmp_root, ASSETS_PREFIX)
+    with open(os.path.join(tmp_root, IMAGES_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(images["images"], f, indent=2, ensure_ascii=False)
+
+    manifest = dict(images["assets"])
+    for url, path in _collect():
+        with open(path, "rb") as f:
+            data = f.read()
+        if url.endswith(".css"):
+            data = _rewrite_css(data.decode("utf-8"), manifest).encode("utf-8")
+
+        digest = hashlib.sha256(data).hexdigest()[:HASH_LEN]
+        stem, ext = os.path.splitext(url.lstrip("/"))
+        rel_out = f"{stem}.{digest}{ext}"
+        out_path = os.path.join(tmp_root, rel_out)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, "wb") as f:
+            f.write(data)
+        if ext.lower() in COMPRESSIBLE:
+            _write_variants(out_path, data)
+
+        manifest[url] = f"{ASSETS_PREFIX}/{rel_out}"
+
+    with open(os.path.join(tmp_root, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    # Готовая сборка получает постоянное имя, затем на неё переключается симлинк
+    os.replace(tmp_root, build_root)
+    _activate(out_root, build_root)
+    _prune(builds_root, max(KEEP_BUILDS, 1))
+    return manifest
+
+
+if __name__ == "__main__":
+    if brotli is None:
+        print("WARNING: brotli не установлен — .br варианты не будут созданы", file=sys.stderr)
+    result = build()
+    print(f"Built {len(result)} assets into {ASSETS_DIR}/ -> {os.path.realpath(os.path.join(ROOT, ASSETS_DIR))}")
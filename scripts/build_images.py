@@ -0,0 +1,119 @@
+# scripts/build_images.py
+# Уменьшенные WebP/AVIF-варианты картинок для srcset. Вызывается из scripts/build_assets.py
+# (пишет в тот же собираемый каталог static_build/; манифест images.json записывает build_assets).
+#
+# Нужен Pillow; AVIF — Pillow >= 11.2 или pillow-avif-plugin. Без Pillow шаг пропускается.
+import os
+import io
+import glob
+import hashlib
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import pillow_avif  # noqa: F401  (регистрирует AVIF в старых Pillow)
+except ImportError:
+    pass
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Ширины вариантов; больше исходной не делаем, шире max(WIDTHS) — тоже (лимит WebP — 16383px,
+# а полноразмерный AVIF огромной картинки не помещается в память)
+WIDTHS = (64, 160, 320, 640, 960, 1280, 1920)
+QUALITY = {"webp": 80, "avif": 50}
+MIME = {"webp": "image/webp", "avif": "image/avif"}
+HASH_LEN = 10
+# Защита от "бомб": картинки больше лимита не декодируем (RGBA 100 Мпикс — уже ~400 МБ памяти).
+# static/funpay.png (30000x11317, ~340 Мпикс) сюда не проходит — вариантов у неё нет,
+# отдаётся оригинал с хэшем из build_assets.
+MAX_IMAGE_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(100_000_000)))
+# URL-префикс в шаблонах -> (каталог исходников, маска) для картинок, которых нет в static/.
+# Тарифы в buy.py ссылаются на /static/products/<N>days.png, но каталога static/products нет:
+# файлы лежат в templates/. Без сборки эти URL отдают 404; после неё asset_url ведёт на копию
+# оригинала в /assets (см. build), а picture() — на её WebP/AVIF-варианты.
+EXTRA_SOURCES = {
+    "/static/products": ("templates", "*days.png"),
+}
+
+
+def sources() -> dict:
+    """URL в шаблонах -> исходный файл: static/*.png и EXTRA_SOURCES."""
+    found = {}
+    for path in sorted(glob.glob(os.path.join(ROOT, "static", "*.png"))):
+        found[f"/static/{os.path.basename(path)}"] = path
+    for prefix, (directory, pattern) in EXTRA_SOURCES.items():
+        for path in sorted(glob.glob(os.path.join(ROOT, directory, pattern))):
+            found[f"{prefix}/{os.path.basename(path)}"] = path
+    return found
+
+
+def _formats() -> list:
+    Image.init()
+    return [f for f in ("avif", "webp") if f.upper() in Image.SAVE]
+
+
+def _encode(img, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format=fmt.upper(), quality=QUALITY[fmt])
+    return buf.getvalue()
+
+
+def _write(out_root: str, rel: str, data: bytes) -> str:
+    path = os.path.join(out_root, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return rel
+
+
+def _variants(path: str, formats: list, out_root: str, prefix: str) -> dict:
+    with Image.open(path) as src:
+        if src.width * src.height > MAX_IMAGE_PIXELS:
+            raise ValueError(f"{src.width}x{src.height} exceeds IMAGE_MAX_PIXELS={MAX_IMAGE_PIXELS}")
+        src.load()
+        img = src.convert("RGBA" if "A" in src.getbands() or "transparency" in src.info else "RGB")
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    width, height = img.size
+    variants = {MIME[f]: [] for f in formats}
+    for w in sorted({w for w in WIDTHS if w < width} | {min(width, max(WIDTHS))}):
+        resized = img if w == width else img.resize((w, max(1, round(height * w / width))), Image.LANCZOS)
+        for fmt in formats:
+            data = _encode(resized, fmt)
+            digest = hashlib.sha256(data).hexdigest()[:HASH_LEN]
+            rel = _write(out_root, f"img/{stem}.{w}w.{digest}.{fmt}", data)
+            variants[MIME[fmt]].append([f"{prefix}/{rel}", w])
+    return {"width": width, "height": height, "variants": variants}
+
+
+def build(out_root: str, prefix: str) -> dict:
+    """
+    Возвращает {"images": {url: {width, height, variants: {mime: [[url, w], ...]}}},
+                "assets": {url: url оригинала с хэшем}} — последнее для исходников вне static/.
+    """
+    if Image is None:
+        print("WARNING: Pillow не установлен — варианты картинок не будут созданы")
+        return {"images": {}, "assets": {}}
+
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    formats = _formats()
+    images, extra_assets = {}, {}
+
+    for url, path in sources().items():
+        if os.path.dirname(url) != "/static":
+            # Оригинал тоже кладём в сборку — иначе fallback-<img> некуда вести
+            with open(path, "rb") as f:
+                original = f.read()
+            digest = hashlib.sha256(original).hexdigest()[:HASH_LEN]
+            rel = _write(out_root, f"{url.lstrip('/').rsplit('.', 1)[0]}.{digest}.png", original)
+            extra_assets[url] = f"{prefix}/{rel}"
+
+        # Ошибка одной картинки (размер, кодек, память) не должна ронять сборку статики
+        try:
+            images[url] = _variants(path, formats, out_root, prefix)
+        except Exception as e:
+            print(f"WARNING: skip {path}: {e}")
+
+    return {"images": images, "assets": extra_assets}
@@ -0,0 +1,39 @@
+# scripts/publish_build.py
+# Публикация новой версии защищённого билда с бинарными патчами от предыдущих версий.
+#
+#   python scripts/publish_build.py build/FPBooster_Plus.dll.enc
+#   python scripts/publish_build.py out/app.exe --name FPBooster.exe
+#   python scripts/publish_build.py --migrate        # перенос старых версий releases/<name>/<sha256> в cas/
+#
+# Патчи строятся, если установлен bsdiff4 и/или zstandard (pip install bsdiff4 zstandard).
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import build_store  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish a protected build")
+    parser.add_argument("file", nargs="?", help="Путь к новому билду")
+    parser.add_argument("--name", help="Имя файла в protected_builds (по умолчанию — имя исходного)")
+    parser.add_argument("--migrate", action="store_true", help="Только перенести версии старой раскладки в cas/")
+    args = parser.parse_args()
+
+    if args.migrate:
+        print(json.dumps(build_store.migrate_all(), indent=2))
+        return
+    if not args.file:
+        parser.error("file is required")
+
+    if build_store.bsdiff4 is None and build_store.zstandard is None:
+        print("WARNING: ни bsdiff4, ни zstandard не установлены — патчи не будут построены", file=sys.stderr)
+
+    result = build_store.publish(args.file, args.name)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,10 +8,9 @@ from typing import Optional, Literal
 from datetime import date, datetime, timedelta
 
 import asyncpg
-from fastapi import FastAPI, HTTPException, Request, Depends, Form, Header
-from fastapi.responses import HTMLResponse, RedirectResponse, Response, PlainTextResponse, JSONResponse, FileResponse
+from fastapi import FastAPI, HTTPException, Request, Depends, Form, Header, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, Response, PlainTextResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel, validator
 
 # --- ИМПОРТЫ ПРОЕКТА ---
@@ -20,6 +19,21 @@ from auth.jwt_utils import verify_password, make_jwt
 # Добавляем этот импорт:
 from auth.guards import get_current_user 
 import groups_router
+import stats_service
+import page_cache
+import pagination
+import user_search
+import key_batches
+import admin_export
+import analytics
+import subscription_sweeper
+import group_catalog
+import artifacts
+import build_store
+import offload
+import assets
+import templating
+from templating import templates
 
 # --- Вспомогательная функция (ВСТАВИТЬ ПЕРЕД ОБЪЯВЛЕНИЕМ РОУТОВ) ---
 async def get_user_safe(request: Request):
@@ -43,7 +57,6 @@ async def current_user(request: Request):
     return await get_current_user(request)
 
 app = FastAPI(title="FPBooster License Server", version="1.6.0")
-templates = Jinja2Templates(directory="templates")
 
 async def ui_guard(request: Request):
     # Исправлено: убрали второй аргумент, добавили await
@@ -51,22 +64,42 @@ async def ui_guard(request: Request):
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
-    # 1. Получаем пользователя (безопасно)
+    # 1. Статистика из памяти (stats_service обновляет её в фоне)
+    stats = stats_service.get_stats(request.app)
+
+    # 2. Гостю отдаём готовый HTML из кэша (page_cache.py)
+    if page_cache.is_anonymous(request):
+        return page_cache.cached_response(request, "/", lambda: templates.TemplateResponse("index.html", {
+            "request": request,
+            "user": None,
+            "stats": stats
+        }))
+
+    # 3. Получаем пользователя (безопасно)
     user = await get_user_safe(request)
-    
-    # 2. Логика статистики (оставляем твою или берем эту)
-    async with request.app.state.pool.acquire() as conn:
-        users_count = await conn.fetchval("SELECT COUNT(*) FROM users") or 0
-    
-    stats = {"users": users_count, "runs": users_count * 12} 
 
-    # 3. Передаем user в шаблон
+    # 4. Передаем user в шаблон
     return templates.TemplateResponse("index.html", {
         "request": request, 
         "user": user,       # <--- ВАЖНО: это чинит шапку
         "stats": stats
     })
 
+# --- ПРАВОВЫЕ СТРАНИЦЫ (ссылки со страницы регистрации) ---
+@app.get("/eula", response_class=HTMLResponse)
+async def eula_page(request: Request):
+    if page_cache.is_anonymous(request):
+        return page_cache.cached_response(request, "/eula", lambda: templates.TemplateResponse("eula.html", {"request": request, "user": None}), ttl=3600)
+    user = await get_user_safe(request)
+    return templates.TemplateResponse("eula.html", {"request": request, "user": user})
+
+@app.get("/datahandle", response_class=HTMLResponse)
+async def datahandle_page(request: Request):
+    if page_cache.is_anonymous(request):
+        return page_cache.cached_response(request, "/datahandle", lambda: templates.TemplateResponse("datahandle.html", {"request": request, "user": None}), ttl=3600)
+    user = await get_user_safe(request)
+    return templates.TemplateResponse("datahandle.html", {"request": request, "user": user})
+
 # --- РОУТЕРЫ АВТОРИЗАЦИИ ---
 from auth.users_router import router as users_router
 from auth.email_confirm import router as email_confirm_router
@@ -94,6 +127,9 @@ from referrals import router as referrals_router
 from purchases_router import router as purchases_router
 from buy import router as buy_router
 from payments import router as payments_router
+import janitor
+import payments
+from payment_gateway import PaymentGateway
 
 app.include_router(payments_router, tags=["payments"])
 app.include_router(buy_router, tags=["buy"])
@@ -102,6 +138,20 @@ app.include_router(admin_creators_router)
 app.include_router(referrals_router)
 app.include_router(purchases_router, tags=["purchases"])
 app.include_router(groups_router.router)
+app.include_router(janitor.router)
+app.include_router(page_cache.router)
+app.include_router(key_batches.router)
+app.include_router(admin_export.router)
+app.include_router(analytics.router)
+app.include_router(subscription_sweeper.router)
+app.include_router(artifacts.router)
+# Подписанные ссылки на само приложение — только в режиме signed_url
+if offload.OFFLOAD_MODE == "signed_url":
+    app.include_router(offload.router)
+app.include_router(templating.router)
+# Локальная проверка X-Accel-Redirect без nginx (DOWNLOAD_OFFLOAD_EMULATE=1)
+if offload.OFFLOAD_EMULATE:
+    app.middleware("http")(offload.accel_middleware)
 
 # --- ПОДКЛЮЧЕНИЕ ПЛАГИНОВ ---
 # Это добавит API методы плагина (например /api/plus/autobump/set)
@@ -113,6 +163,8 @@ from fastapi.staticfiles import StaticFiles
 app.mount("/static", StaticFiles(directory="static"), name="static")
 app.mount("/templates_css", StaticFiles(directory="templates_css"), name="templates_css")
 app.mount("/JavaScript", StaticFiles(directory="JavaScript"), name="javascript")
+# Собранная статика с хэшами в именах (scripts/build_assets.py), кэш immutable
+assets.mount(app)
 
 # --- МОДЕЛИ ---
 
@@ -129,14 +181,54 @@ class LauncherLogin(BaseModel):
 async def startup():
     # 1. Подключение к БД
     app.state.pool = await asyncpg.create_pool(dsn=DB_URL, min_size=1, max_size=5, command_timeout=10)
+
+    # Справочник групп в памяти + LISTEN groups_changed на отдельном соединении
+    await group_catalog.start(app)
+    asyncio.create_task(group_catalog.listen_worker(DB_URL))
+    # Сброс кэша страниц из админки доходит до всех воркеров (LISTEN page_cache_invalidate)
+    asyncio.create_task(page_cache.listen_worker(DB_URL))
+
+    # Клиент платёжного шлюза (один пул соединений на процесс)
+    app.state.gateway = PaymentGateway(api_token=payments.API_TOKEN)
     
     # 2. Запуск фоновых задач плагинов (AutoBump)
     # Передаем 'app', чтобы воркер имел доступ к пулу БД (app.state.pool)
     asyncio.create_task(AutoBump.worker(app))
     asyncio.create_task(AutoRestock.worker(app))
 
+    # 3. Фоновая уборка таблиц (janitor.py)
+    asyncio.create_task(janitor.worker(app))
+
+    # 4. Выдача оплаченных счетов из payment_outbox
+    asyncio.create_task(payments.outbox_worker(app))
+
+    # 5. Счётчики для главной: первый раз считаем сразу, дальше — в фоне
+    try:
+        await stats_service.refresh(app)
+    except Exception as e:
+        print(f"[Stats] initial refresh failed: {e}")
+    asyncio.create_task(stats_service.worker(app))
+
+    # 6. Дневные сводки для /admin/analytics
+    asyncio.create_task(analytics.worker(app))
+
+    # 7. Снятие истёкших подписок (user_groups.is_active = FALSE)
+    asyncio.create_task(subscription_sweeper.worker(app))
+
+    # 8. Манифест защищённых билдов (отсутствующие файлы видны в логе сразу)
+    try:
+        await artifacts.manifest.rebuild(app.state.pool)
+    except Exception as e:
+        print(f"[Artifacts] initial manifest failed: {e}")
+    asyncio.create_task(artifacts.watch_worker(app))
+
+    # 9. Шаблоны: компилируем все сразу (или берём из bytecode cache), а не на первом запросе
+    templating.precompile()
+
 @app.on_event("shutdown")
 async def shutdown():
+    gateway = getattr(app.state, "gateway", None)
+    if gateway: await gateway.close()
     pool = app.state.pool
     if pool: await pool.close()
 
@@ -146,6 +238,10 @@ def admin_guard_api(request: Request):
     if token != app.state.ADMIN_TOKEN: raise HTTPException(403, "Invalid admin token")
     return True
 
+@app.get("/admin/gateway/metrics")
+async def gateway_metrics(request: Request, _=Depends(ui_guard)):
+    return request.app.state.gateway.metrics.snapshot()
+
 @app.get("/api/health")
 async def health():
     try:
@@ -253,7 +349,8 @@ async def get_client_products(request: Request, user_data=Depends(current_user))
         "description": "Стабильная версия 1.16.5",
         "image_url": "pack://application:,,,/Assets/FPBoosterDef.png",
         "is_available": has_standard,
-        "download_url": "/api/client/get-core?ver=standard"
+        "download_url": "/api/client/get-core?ver=standard",
+        **artifacts.artifact_info(artifacts.core_artifact("standard"))
     })
 
     # Plus (Уровень 2+)
@@ -263,7 +360,8 @@ async def get_client_products(request: Request, user_data=Depends(current_user))
         "description": "Расширенная версия",
         "image_url": "pack://application:,,,/Assets/FPBooster+Def.png",
         "is_available": has_plus,
-        "download_url": "/api/client/get-core?ver=plus"
+        "download_url": "/api/client/get-core?ver=plus",
+        **artifacts.artifact_info(artifacts.core_artifact("plus"))
     })
 
     # Alpha (Уровень 3+)
@@ -273,7 +371,8 @@ async def get_client_products(request: Request, user_data=Depends(current_user))
         "description": "Бета-версия (Early Access)",
         "image_url": "pack://application:,,,/Assets/FPBoosterAlpha.png",
         "is_available": has_alpha, 
-        "download_url": "/api/client/get-core?ver=alpha"
+        "download_url": "/api/client/get-core?ver=alpha",
+        **artifacts.artifact_info(artifacts.core_artifact("alpha"))
     })
 
     return products
@@ -294,31 +393,19 @@ async def get_client_core(request: Request, ver: str = "standard", user_data = D
         if active == 0:
              raise HTTPException(403, "No active license")
 
-    # 2. Выбираем файл
-    filename = "FPBooster.dll.enc"
-    if ver == "alpha": filename = "FPBooster_Alpha.dll.enc"
-    elif ver == "plus": filename = "FPBooster_Plus.dll.enc"
-
-    # Путь к папке с билдами
-    protected_folder = os.path.join(BASE_DIR, "protected_builds") 
-    file_path = os.path.join(protected_folder, filename)
-    
-    # Фолбэк (если запрошенного файла нет, отдаем обычный)
-    if not os.path.exists(file_path):
-        file_path = os.path.join(protected_folder, "FPBooster.dll.enc")
-
-    if not os.path.exists(file_path):
-        print(f"CRITICAL: File not found: {file_path}")
+    # 2. Выбираем файл (общий mmap-кэш artifacts.py)
+    artifact = artifacts.core_artifact(ver)
+    if artifact is None:
+        print(f"CRITICAL: Core build not found for ver={ver} in {artifacts.PROTECTED_BUILDS_DIR}")
         raise HTTPException(500, "Build not found on server")
 
-    with open(file_path, "rb") as f:
-        file_bytes = f.read()
+    # Сжатый вариант из cas/ по Accept-Encoding (если построен при публикации)
+    body, encoding = build_store.encoded_variant(request, artifact)
+    headers = {"X-Decryption-Key": SERVER_SIDE_AES_KEY, **build_store.variant_headers(artifact, encoding)}
 
-    return Response(
-        content=file_bytes, 
-        media_type="application/octet-stream",
-        headers={"X-Decryption-Key": SERVER_SIDE_AES_KEY} 
-    )
+    # ETag / 304 / Range — лаунчер не качает неизменённый билд и докачивает оборванный.
+    # В режиме DOWNLOAD_OFFLOAD байты отдаёт фронтовый сервер (offload.py)
+    return offload.offload_response(request, body, headers=headers)
 
 # --- ПРОФИЛЬ ПОЛЬЗОВАТЕЛЯ ---
 class UserProfileData(BaseModel):
@@ -476,6 +563,7 @@ async def get_api_products(request: Request):
                     "image_url": row['image_url'], 
                     "is_available": row['is_available'],
                     "download_url": secure_url,
+                    **artifacts.artifact_info(artifacts.product_artifact(row['id'])),
                     # Можно добавить поле required_level, если лаунчеру это нужно
                 })
             return products
@@ -490,6 +578,7 @@ async def download_product(
     request: Request,
     product_id: int, 
     x_hwid: Optional[str] = Header(None, alias="X-HWID"), 
+    from_hash: Optional[str] = Query(None, alias="from"),
     user_row = Depends(get_current_user)
 ):
     try:
@@ -536,32 +625,12 @@ async def download_product(
                         "message": "Аккаунт привязан к другому ПК."
                     }, status_code=403)
 
-            # 4. ЛОГИКА ОПРЕДЕЛЕНИЯ ПУТИ К ФАЙЛУ
-            protected_folder = "/opt/fpbooster/protected_builds"
-            
-            # Список возможных имен файлов для этого продукта (приоритетный порядок)
-            possible_filenames = []
-            if prod['exe_name']: possible_filenames.append(prod['exe_name'])
-            if prod['download_url']: possible_filenames.append(prod['download_url'])
-            
-            # Фолбэки, если в базе странные данные
-            if product_id == 1: possible_filenames.append("FPBoosterPlus.dll")
-            if product_id == 2: possible_filenames.append("FPBoosterDefault.dll")
-            possible_filenames.append("FPBooster.exe")
-
-            final_file_path = None
-            final_filename = "software.dat"
-
-            for fname in possible_filenames:
-                temp_path = os.path.join(protected_folder, fname)
-                if os.path.exists(temp_path):
-                    final_file_path = temp_path
-                    final_filename = fname
-                    break
-
-            if not final_file_path:
-                print(f"CRITICAL: No file found for product {product_id} in {protected_folder}")
-                print(f"Tried names: {possible_filenames}")
+            # 4. ФАЙЛ ПРОДУКТА (манифест artifacts.py; имя файла — по только что прочитанной строке products)
+            artifact = artifacts.product_artifact(product_id, prod)
+
+            if artifact is None:
+                print(f"CRITICAL: No file found for product {product_id} in {artifacts.PROTECTED_BUILDS_DIR}")
+                print(f"Tried names: {artifacts.product_filenames(product_id, prod)}")
                 return JSONResponse({"error": f"File missing on server. Please contact admin."}, status_code=404)
 
             # 5. ОТПРАВКА
@@ -569,11 +638,20 @@ async def download_product(
 
             headers = {
                 "X-Encryption-Key": key_to_send,
-                "Content-Disposition": f'attachment; filename="{final_filename}"',
-                "Access-Control-Expose-Headers": "X-Encryption-Key"
+                "Content-Disposition": f'attachment; filename="{artifact.name}"',
+                "Access-Control-Expose-Headers": "X-Encryption-Key, ETag, Content-Range, X-Patch-Format, X-Patch-From, X-Build-Hash, X-Content-SHA256"
             }
-            
-            return FileResponse(final_file_path, headers=headers, media_type='application/octet-stream')
+
+            # 6. Лаунчер прислал хэш своей версии (?from=) — отдаём патч, если он построен
+            patch = build_store.patch_for(artifact, from_hash)
+            if patch:
+                patch_artifact, patch_format = patch
+                headers.update(build_store.patch_headers(artifact, from_hash, patch_format))
+                return offload.offload_response(request, patch_artifact, headers=headers)
+
+            body, encoding = build_store.encoded_variant(request, artifact)
+            headers.update(build_store.variant_headers(artifact, encoding))
+            return offload.offload_response(request, body, headers=headers)
 
     except Exception as e:
         import traceback
@@ -613,27 +691,40 @@ async def admin_logout():
 
 # --- УПРАВЛЕНИЕ КЛЮЧАМИ (Вместо лицензий) ---
 
+async def _key_inventory_context(request: Request, base_path: str) -> dict:
+    """Общие данные для /admin/keys и /admin/tokens: страница ключей, фильтры, сводка."""
+    params = request.query_params
+    filters = key_batches.parse_key_filters(params)
+    limit = pagination.clamp_page_size(int(params["limit"]) if (params.get("limit") or "").isdigit() else None)
+    direction = "prev" if params.get("direction") == "prev" else "next"
+
+    async with app.state.pool.acquire() as conn:
+        page = await key_batches.list_keys(conn, filters, params.get("cursor"), direction, limit)
+        counts = await key_batches.key_counts(conn)
+        # Последние партии (ссылки на выгрузку)
+        batches = await key_batches.recent_batches(conn)
+
+    return {
+        "request": request,
+        "rows": page["rows"],
+        "keys": page["rows"],
+        "next_cursor": page["next_cursor"],
+        "prev_cursor": page["prev_cursor"],
+        "limit": limit,
+        "filters": filters,
+        "filters_qs": key_batches.filters_query(filters),
+        "counts": counts,
+        # Список групп для формы создания и фильтра (справочник в памяти)
+        "groups": group_catalog.catalog.all(),
+        "batches": batches,
+        "base_path": base_path,
+        "q": "",
+    }
+
 @app.get("/admin/keys", response_class=HTMLResponse)
 async def admin_keys_list(request: Request, _=Depends(ui_guard)):
-    """Страница со списком всех ключей"""
-    async with app.state.pool.acquire() as conn:
-        # Получаем ключи и имена групп
-        keys = await conn.fetch("""
-            SELECT gk.id, gk.key_code, gk.duration_days, gk.is_used, gk.created_at, g.name as group_name
-            FROM group_keys gk
-            LEFT JOIN groups g ON gk.group_id = g.id
-            ORDER BY gk.created_at DESC
-            LIMIT 100
-        """)
-        # Получаем список групп для формы создания
-        groups = await conn.fetch("SELECT id, name, slug FROM groups ORDER BY access_level ASC")
-        
-    # Вам понадобится шаблон keys.html (можно скопировать users.html и упростить)
-    # Если шаблона нет, покажем простой текст или JSON для теста
-    try:
-        return templates.TemplateResponse("keys.html", {"request": request, "keys": keys, "groups": groups})
-    except:
-        return JSONResponse({"detail": "Template keys.html not found, but data works", "keys": [dict(k) for k in keys]})
+    """Страница со списком ключей (фильтры + keyset-пагинация)"""
+    return templates.TemplateResponse("keys.html", await _key_inventory_context(request, "/admin/keys"))
 
 @app.post("/admin/keys/create")
 async def admin_create_keys(
@@ -643,18 +734,9 @@ async def admin_create_keys(
     count: int = Form(1), 
     _=Depends(ui_guard)
 ):
-    import secrets
-    if count > 50: count = 50
-    
-    async with app.state.pool.acquire() as conn:
-        for _ in range(count):
-            # Генерируем ключ формата XXXX-YYYY-ZZZZ
-            code = f"{secrets.token_hex(2)}-{secrets.token_hex(2)}-{secrets.token_hex(2)}".upper()
-            await conn.execute("""
-                INSERT INTO group_keys (key_code, group_id, duration_days) 
-                VALUES ($1, $2, $3)
-            """, code, group_id, days)
-            
+    # Вся партия одной транзакцией через COPY (key_batches.py)
+    if count > key_batches.KEY_BATCH_MAX: count = key_batches.KEY_BATCH_MAX
+    await key_batches.create_batch(app.state.pool, group_id, days, count)
     return RedirectResponse(url="/admin/keys", status_code=302)
 
 @app.get("/admin/keys/delete/{id}")
@@ -692,34 +774,85 @@ GROUP_COLORS = {
 }
 
 @app.get("/admin/users", response_class=HTMLResponse)
-async def admin_users(request: Request, q: Optional[str] = None, _=Depends(ui_guard)):
+async def admin_users(
+    request: Request,
+    q: Optional[str] = None,
+    cursor: Optional[str] = None,
+    direction: Literal["next", "prev"] = "next",
+    limit: Optional[int] = None,
+    _=Depends(ui_guard)
+):
+    limit = pagination.clamp_page_size(limit)
+    position = pagination.decode_cursor(cursor)
+
+    # Фильтры страницы: поиск + keyset-курсор (created_at, id)
+    where, args = [], []
+    if q:
+        # Условие под индексы (pg_trgm / префиксы), см. user_search.py
+        search_sql, search_args = user_search.build_user_filter(q, len(args) + 1)
+        where.append(search_sql)
+        args.extend(search_args)
+    if position:
+        where.append(pagination.keyset_clause(direction, len(args) + 1, "u"))
+        args.extend(position)
+    else:
+        direction = "next"
+    args.append(limit + 1)
+
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+    inner_order = "ASC" if direction == "prev" else "DESC"
+
     async with app.state.pool.acquire() as conn:
-        # Получаем пользователей и их АКТИВНУЮ группу (если есть)
-        query_base = """
-             SELECT u.id, u.email, u.username, u.uid, u.created_at, u.last_login, u.email_confirmed,
-                    COALESCE((SELECT SUM(amount) FROM purchases p WHERE p.user_uid = u.uid), 0) as total_spent,
-                    g.name as group_name, g.slug as group_slug
-             FROM users u
-             LEFT JOIN user_groups ug ON u.uid = ug.user_uid AND ug.is_active = TRUE AND ug.expires_at > NOW()
-             LEFT JOIN groups g ON ug.group_id = g.id
-        """
-        
-        # Сортировка: сначала новые регистрации
-        if q:
-            rows = await conn.fetch(
-                f"{query_base} WHERE u.email ILIKE $1 OR u.username ILIKE $1 OR CAST(u.uid AS TEXT) ILIKE $1 ORDER BY u.created_at DESC", 
-                f"%{q}%"
+        # Сначала выбираем страницу пользователей по индексу (created_at, id),
+        # сумму покупок и активную группу считаем только для неё
+        rows = await conn.fetch(f"""
+            WITH page AS (
+                SELECT u.id, u.email, u.username, u.uid, u.created_at, u.last_login, u.email_confirmed
+                FROM users u
+                {where_sql}
+                ORDER BY u.created_at {inner_order}, u.id {inner_order}
+                LIMIT ${len(args)}
             )
-        else:
-            rows = await conn.fetch(f"{query_base} ORDER BY u.created_at DESC")
+            SELECT page.*,
+                   COALESCE(sp.total, 0) AS total_spent,
+                   grp.name AS group_name, grp.slug AS group_slug
+            FROM page
+            LEFT JOIN LATERAL (
+                SELECT SUM(p.amount) AS total FROM purchases p WHERE p.user_uid = page.uid
+            ) sp ON TRUE
+            LEFT JOIN LATERAL (
+                SELECT g.name, g.slug
+                FROM user_groups ug
+                JOIN groups g ON ug.group_id = g.id
+                WHERE ug.user_uid = page.uid AND ug.is_active = TRUE AND ug.expires_at > NOW()
+                ORDER BY g.access_level DESC
+                LIMIT 1
+            ) grp ON TRUE
+            ORDER BY page.created_at {inner_order}, page.id {inner_order}
+        """, *args)
+
+        # Общее число — оценка из статистики планировщика (без COUNT(*))
+        approx_total = None if q else await stats_service.approx_count(conn, "users")
+
+    page = pagination.build_page(rows, limit, direction, position is not None)
 
     return templates.TemplateResponse("users.html", {
         "request": request, 
-        "rows": rows, 
+        "rows": page["rows"], 
         "q": q or "",
+        "next_cursor": page["next_cursor"],
+        "prev_cursor": page["prev_cursor"],
+        "limit": limit,
+        "approx_total": approx_total,
         "group_colors": GROUP_COLORS
     })
 
+@app.get("/admin/users/search.json")
+async def admin_users_typeahead(request: Request, q: str = "", _=Depends(ui_guard)):
+    """Автодополнение для поиска пользователей (email / логин / UID)."""
+    async with app.state.pool.acquire() as conn:
+        return await user_search.typeahead(conn, q)
+
 @app.get("/admin/users/edit/{uid}", response_class=HTMLResponse)
 async def edit_user_form(request: Request, uid: str, _=Depends(ui_guard)):
     async with app.state.pool.acquire() as conn:
@@ -738,16 +871,13 @@ async def edit_user_form(request: Request, uid: str, _=Depends(ui_guard)):
             ORDER BY ug.is_active DESC, ug.expires_at DESC
         """, uid)
 
-        # 2. Получаем список всех доступных групп для выпадающего списка
-        all_groups = await conn.fetch("SELECT id, name, slug FROM groups ORDER BY access_level ASC")
-
     return templates.TemplateResponse("user_form.html", {
         "request": request, 
         "row": row, 
         "purchases": purchases, 
         "now": datetime.now(),
         "user_groups": user_groups_list, 
-        "all_groups": all_groups,
+        "all_groups": group_catalog.catalog.all(),
         "group_colors": GROUP_COLORS,
         "error": None
     })
@@ -838,19 +968,8 @@ async def admin_revoke_group(
 
 @app.get("/admin/tokens", response_class=HTMLResponse)
 async def admin_tokens_list(request: Request, _=Depends(ui_guard)):
-    """Отображение ключей доступа"""
-    async with app.state.pool.acquire() as conn:
-        # Загружаем ключи и имена групп
-        keys = await conn.fetch("""
-            SELECT k.id, k.key_code, k.duration_days, k.is_used, k.created_at, g.name as group_name
-            FROM group_keys k
-            LEFT JOIN groups g ON k.group_id = g.id
-            ORDER BY k.created_at DESC LIMIT 100
-        """)
-        groups = await conn.fetch("SELECT id, name FROM groups ORDER BY access_level")
-        
-    # Используем шаблон tokens.html (нужно будет его адаптировать под поля group_keys)
-    return templates.TemplateResponse("tokens.html", {"request": request, "rows": keys, "groups": groups, "q": ""})
+    """Отображение ключей доступа (фильтры + keyset-пагинация)"""
+    return templates.TemplateResponse("tokens.html", await _key_inventory_context(request, "/admin/tokens"))
     
 
 @app.post("/admin/tokens/create")
@@ -861,19 +980,11 @@ async def admin_create_keys(
     count: int = Form(1),
     _=Depends(ui_guard)
 ):
-    if count < 1 or count > 50:
-        return Response("Количество от 1 до 50", status_code=400)
-        
-    import secrets
-    async with app.state.pool.acquire() as conn:
-        for _ in range(count):
-            # Генерируем ключ формата XXXX-YYYY-ZZZZ
-            code = f"{secrets.token_hex(2)}-{secrets.token_hex(2)}-{secrets.token_hex(2)}".upper()
-            await conn.execute("""
-                INSERT INTO group_keys (key_code, group_id, duration_days) 
-                VALUES ($1, $2, $3)
-            """, code, group_id, days)
-            
+    if count < 1 or count > key_batches.KEY_BATCH_MAX:
+        return Response(f"Количество от 1 до {key_batches.KEY_BATCH_MAX}", status_code=400)
+
+    # Вся партия одной транзакцией через COPY (key_batches.py)
+    await key_batches.create_batch(app.state.pool, group_id, days, count)
     return RedirectResponse(url="/admin/tokens", status_code=302)
 
 @app.get("/admin/tokens/delete/{id}")
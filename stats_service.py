@@ -0,0 +1,54 @@
+# stats_service.py
+# Счётчики для главной страницы в памяти процесса.
+# Обновляются фоновой задачей, на запросе "/" к БД не обращаемся.
+import os
+import asyncio
+from datetime import datetime
+
+STATS_REFRESH_SECONDS = int(os.getenv("STATS_REFRESH_SECONDS", "300"))
+# Сколько "запусков" показываем на одного пользователя (маркетинговая метрика)
+RUNS_PER_USER = 12
+
+
+def empty_stats() -> dict:
+    return {"users": 0, "runs": 0}
+
+
+async def approx_count(conn, table: str) -> int:
+    """
+    Оценка числа строк из статистики планировщика (pg_class.reltuples).
+    Таблица, по которой ещё не было ANALYZE, отдаёт -1 (или 0) —
+    тогда считаем честно один раз.
+    """
+    estimate = await conn.fetchval(
+        "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass($1)", table
+    )
+    if estimate is None or estimate <= 0:
+        return await conn.fetchval(f"SELECT COUNT(*) FROM {table}") or 0
+    return estimate
+
+
+async def refresh(app) -> dict:
+    async with app.state.pool.acquire() as conn:
+        users_count = await approx_count(conn, "users")
+
+    stats = {"users": users_count, "runs": users_count * RUNS_PER_USER}
+    app.state.site_stats = stats
+    app.state.site_stats_updated_at = datetime.utcnow()
+    return stats
+
+
+def get_stats(app) -> dict:
+    return getattr(app.state, "site_stats", None) or empty_stats()
+
+
+# --- WORKER ---
+async def worker(app):
+    # Первое обновление делает startup, здесь — только периодические
+    while True:
+        await asyncio.sleep(STATS_REFRESH_SECONDS)
+        try:
+            if not hasattr(app.state, 'pool'): continue
+            await refresh(app)
+        except Exception as e:
+            print(f"[Stats] refresh error: {e}", flush=True)
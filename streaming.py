@@ -0,0 +1,77 @@
+# streaming.py
+# Потоковая выгрузка результатов запроса (CSV / TXT / NDJSON) через серверный курсор.
+# Память не зависит от числа строк: держим в руках только одну пачку.
+import io
+import csv
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+from typing import List, Optional
+
+from fastapi.responses import StreamingResponse
+
+STREAM_PREFETCH = 2000
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "txt": "text/plain; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _plain(value):
+    if value is None:
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (UUID, Decimal)):
+        return str(value)
+    return value
+
+
+async def iter_query(pool, sql: str, args: tuple, fmt: str, columns: Optional[List[str]] = None):
+    """
+    Генератор чанков: курсор живёт внутри транзакции (требование asyncpg),
+    соединение возвращается в пул, когда клиент дочитал или отвалился.
+    """
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            buf = io.StringIO()
+            writer = csv.writer(buf) if fmt == "csv" else None
+            header_written = False
+            rows_in_chunk = 0
+
+            async for row in conn.cursor(sql, *args, prefetch=STREAM_PREFETCH):
+                if fmt == "csv":
+                    if not header_written:
+                        writer.writerow(columns or list(row.keys()))
+                        header_written = True
+                    writer.writerow([_plain(row[c]) for c in (columns or row.keys())])
+                elif fmt == "txt":
+                    # Одно значение на строку (первая колонка) — удобно для ключей
+                    buf.write(f"{row[0]}\n")
+                else:
+                    buf.write(json.dumps({k: _plain(row[k]) for k in (columns or row.keys())}, ensure_ascii=False) + "\n")
+
+                rows_in_chunk += 1
+                if rows_in_chunk >= STREAM_PREFETCH:
+                    yield buf.getvalue().encode("utf-8")
+                    buf.seek(0)
+                    buf.truncate(0)
+                    rows_in_chunk = 0
+
+            if fmt == "csv" and not header_written and columns:
+                writer.writerow(columns)
+            tail = buf.getvalue()
+            if tail:
+                yield tail.encode("utf-8")
+
+
+def stream_query(pool, sql: str, args: tuple, fmt: str, filename: str, columns: Optional[List[str]] = None) -> StreamingResponse:
+    fmt = fmt if fmt in MEDIA_TYPES else "csv"
+    return StreamingResponse(
+        iter_query(pool, sql, args, fmt, columns),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
@@ -0,0 +1,106 @@
+# subscription_sweeper.py
+# Фоновое снятие истёкших подписок: user_groups с expires_at <= NOW() переводятся в is_active = FALSE
+# пачками. Так частичный индекс по активным строкам (011_user_groups_active.sql) держит только живые подписки.
+# О каждой пачке сообщаем через pg_notify('subscription_changes', ...).
+import os
+import json
+import asyncio
+import time
+from datetime import datetime
+
+from fastapi import APIRouter, Request, Depends
+
+from guards import admin_guard_ui
+
+router = APIRouter(prefix="/admin/subscriptions/sweeper", tags=["Admin Subscriptions"])
+
+SWEEPER_ENABLED = os.getenv("SWEEPER_ENABLED", "1") == "1"
+SWEEPER_INTERVAL_SECONDS = int(os.getenv("SWEEPER_INTERVAL_SECONDS", "60"))
+SWEEPER_BATCH_SIZE = int(os.getenv("SWEEPER_BATCH_SIZE", "1000"))
+SWEEPER_MAX_BATCHES = int(os.getenv("SWEEPER_MAX_BATCHES", "50"))
+
+NOTIFY_CHANNEL = "subscription_changes"
+# Полезная нагрузка NOTIFY ограничена 8000 байт — режем список на куски
+NOTIFY_CHUNK = 100
+
+SWEEP_SQL = """
+    WITH picked AS (
+        SELECT id FROM user_groups
+        WHERE is_active = TRUE AND expires_at <= NOW()
+        ORDER BY expires_at
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE user_groups ug SET is_active = FALSE
+    FROM picked
+    WHERE ug.id = picked.id
+    RETURNING ug.user_uid, ug.group_id, ug.expires_at
+"""
+
+async def _emit(conn, events: list):
+    for i in range(0, len(events), NOTIFY_CHUNK):
+        payload = json.dumps({"event": "expired", "items": events[i:i + NOTIFY_CHUNK]})
+        await conn.execute("SELECT pg_notify($1, $2)", NOTIFY_CHANNEL, payload)
+
+
+async def sweep_batch(pool) -> list:
+    """Одна пачка в своей транзакции. NOTIFY уходит только после COMMIT."""
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            rows = await conn.fetch(SWEEP_SQL, SWEEPER_BATCH_SIZE)
+            events = [
+                {"user_uid": str(r["user_uid"]), "group_id": r["group_id"], "expires_at": r["expires_at"].isoformat()}
+                for r in rows
+            ]
+            if events:
+                await _emit(conn, events)
+    return events
+
+
+async def run_once(app) -> dict:
+    started = time.monotonic()
+    total = 0
+    for _ in range(SWEEPER_MAX_BATCHES):
+        events = await sweep_batch(app.state.pool)
+        total += len(events)
+        if len(events) < SWEEPER_BATCH_SIZE:
+            break
+        await asyncio.sleep(0.05)
+
+    report = {
+        "finished_at": datetime.utcnow().isoformat() + "Z",
+        "deactivated": total,
+        "duration_ms": int((time.monotonic() - started) * 1000),
+    }
+    app.state.sweeper_stats = report
+    if total:
+        print(f"[Sweeper] deactivated={total} in {report['duration_ms']}ms", flush=True)
+    return report
+
+
+# --- WORKER ---
+async def worker(app):
+    await asyncio.sleep(15)
+    if not SWEEPER_ENABLED:
+        print(">>> [Sweeper] disabled", flush=True)
+        return
+    print(">>> [Sweeper] WORKER STARTED", flush=True)
+
+    while True:
+        try:
+            if not hasattr(app.state, 'pool'): await asyncio.sleep(5); continue
+            await run_once(app)
+        except Exception as e:
+            print(f"[Sweeper] error: {e}", flush=True)
+        await asyncio.sleep(SWEEPER_INTERVAL_SECONDS)
+
+
+# --- API ---
+@router.get("/stats")
+async def sweeper_stats(request: Request, _=Depends(admin_guard_ui)):
+    return getattr(request.app.state, "sweeper_stats", None) or {"status": "not_run_yet"}
+
+
+@router.post("/run")
+async def sweeper_run(request: Request, _=Depends(admin_guard_ui)):
+    return await run_once(request.app)
@@ -0,0 +1,124 @@
+# templating.py
+# Одно окружение Jinja на процесс для всех роутеров (раньше каждый модуль создавал свой
+# Jinja2Templates и компилировал те же шаблоны заново).
+#   - FileSystemBytecodeCache: скомпилированный код шаблонов переживает рестарт и общий для воркеров
+#   - precompile() на старте: первый запрос к странице не платит за компиляцию
+#   - время рендера по каждому шаблону: /admin/templates/stats
+import os
+import stat
+import time
+
+import jinja2
+from fastapi import APIRouter, Depends
+from fastapi.templating import Jinja2Templates
+
+import assets
+from guards import admin_guard_ui
+
+TEMPLATES_DIR = "templates"
+# Свой каталог для байткода (из него исполняется код). Не задан — каталог Jinja по умолчанию:
+# _jinja2-cache-<uid> во временном каталоге, который Jinja сама создаёт с правами 0700 и проверяет
+TEMPLATE_BYTECODE_DIR = os.getenv("TEMPLATE_BYTECODE_DIR", "").strip() or None
+# В проде шаблоны меняются только с деплоем — mtime на каждый рендер не проверяем
+TEMPLATES_AUTO_RELOAD = os.getenv("TEMPLATES_AUTO_RELOAD", "0") == "1"
+TEMPLATE_SLOW_MS = float(os.getenv("TEMPLATE_SLOW_MS", "50"))
+
+router = APIRouter(prefix="/admin/templates", tags=["Admin Templates"])
+
+
+class RenderStats:
+    def __init__(self):
+        self.by_template = {}
+
+    def record(self, name: str, seconds: float):
+        ms = seconds * 1000
+        entry = self.by_template.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        entry["count"] += 1
+        entry["total_ms"] += ms
+        entry["max_ms"] = max(entry["max_ms"], ms)
+        if ms > TEMPLATE_SLOW_MS:
+            print(f"[Templates] slow render {name}: {ms:.1f}ms", flush=True)
+
+    def snapshot(self) -> list:
+        rows = [
+            {
+                "template": name,
+                "count": e["count"],
+                "avg_ms": round(e["total_ms"] / e["count"], 2),
+                "max_ms": round(e["max_ms"], 2),
+                "total_ms": round(e["total_ms"], 1),
+            }
+            for name, e in self.by_template.items()
+        ]
+        return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+
+render_stats = RenderStats()
+
+
+class InstrumentedTemplates(Jinja2Templates):
+    """Jinja2Templates, который замеряет рендер (TemplateResponse рендерит сразу, в конструкторе)."""
+
+    def TemplateResponse(self, *args, **kwargs):
+        started = time.perf_counter()
+        response = super().TemplateResponse(*args, **kwargs)
+        template = getattr(response, "template", None)
+        render_stats.record(getattr(template, "name", None) or "?", time.perf_counter() - started)
+        return response
+
+
+def _bytecode_cache() -> jinja2.FileSystemBytecodeCache:
+    """
+    TEMPLATE_BYTECODE_DIR принимается, только если это каталог (не симлинк) пользователя сервера
+    с правами 0700: иначе кто-то другой может подложить туда байткод. Не подошёл — каталог по умолчанию.
+    """
+    if TEMPLATE_BYTECODE_DIR is None:
+        return jinja2.FileSystemBytecodeCache()
+    try:
+        os.makedirs(TEMPLATE_BYTECODE_DIR, mode=0o700, exist_ok=True)
+        st = os.lstat(TEMPLATE_BYTECODE_DIR)
+    except OSError as e:
+        print(f"WARNING: TEMPLATE_BYTECODE_DIR {TEMPLATE_BYTECODE_DIR}: {e} — используем каталог Jinja по умолчанию")
+        return jinja2.FileSystemBytecodeCache()
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        print(f"WARNING: TEMPLATE_BYTECODE_DIR {TEMPLATE_BYTECODE_DIR} должен принадлежать пользователю сервера "
+              f"и иметь права 0700 — используем каталог Jinja по умолчанию")
+        return jinja2.FileSystemBytecodeCache()
+    return jinja2.FileSystemBytecodeCache(TEMPLATE_BYTECODE_DIR)
+
+
+def _make_env() -> jinja2.Environment:
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader(TEMPLATES_DIR),
+        autoescape=True,
+        auto_reload=TEMPLATES_AUTO_RELOAD,
+        bytecode_cache=_bytecode_cache(),
+        # Все шаблоны помещаются в кэш окружения — ничего не вытесняется и не компилируется повторно
+        cache_size=-1,
+    )
+
+
+templates = assets.install(InstrumentedTemplates(env=_make_env()))
+
+
+def precompile() -> dict:
+    """Загружает (компилирует или берёт из bytecode cache) все .html-шаблоны."""
+    started = time.perf_counter()
+    loaded, failed = 0, {}
+    for name in templates.env.list_templates(extensions=["html"]):
+        try:
+            templates.env.get_template(name)
+            loaded += 1
+        except jinja2.TemplateError as e:
+            failed[name] = str(e)
+    report = {"loaded": loaded, "failed": failed, "ms": round((time.perf_counter() - started) * 1000, 1)}
+    print(f"[Templates] precompiled {loaded} templates in {report['ms']}ms", flush=True)
+    for name, err in failed.items():
+        print(f"[Templates] FAILED {name}: {err}", flush=True)
+    return report
+
+
+# --- API ---
+@router.get("/stats")
+async def templates_stats(_=Depends(admin_guard_ui)):
+    return render_stats.snapshot()
@@ -0,0 +1,64 @@
+# user_search.py
+# Поиск пользователей в админке. Условия подобраны так, чтобы их обслуживали индексы
+# из db/migrations/007_users_search.sql:
+#   - полный UUID           -> uid = $n              (UNIQUE-индекс uid)
+#   - похоже на адрес       -> email LIKE 'q%'       (btree text_pattern_ops)
+#     (user@domain.tld...; "@gmail.com" или "ivan@" ищутся подстрокой ниже)
+#   - uid-префикс (hex)     -> uid::text LIKE 'q%'   (btree text_pattern_ops)
+#   - всё остальное (>= 3)  -> ILIKE '%q%'           (GIN pg_trgm по email/username/uid)
+import re
+import uuid
+from typing import List, Tuple
+
+TYPEAHEAD_LIMIT = 10
+
+# Начало адреса: локальная часть, "@", домен с точкой
+_EMAIL_PREFIX_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]*$")
+_UID_PREFIX_RE = re.compile(r"^[0-9a-f]{8}(-[0-9a-f]{0,4}){0,4}[0-9a-f]*$")
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def build_user_filter(q: str, first_param: int = 1, alias: str = "u") -> Tuple[str, List]:
+    """Возвращает (SQL-условие, аргументы) для поиска по строке q."""
+    q = (q or "").strip()
+    n = first_param
+
+    try:
+        return f"{alias}.uid = ${n}", [uuid.UUID(q)]
+    except ValueError:
+        pass
+
+    lowered = q.lower()
+    if _EMAIL_PREFIX_RE.match(lowered):
+        # Email хранится в нижнем регистре (см. /register)
+        return f"{alias}.email LIKE ${n}", [escape_like(lowered) + "%"]
+
+    if _UID_PREFIX_RE.match(lowered):
+        return (
+            f"({alias}.uid::text LIKE ${n} OR {alias}.username ILIKE ${n + 1})",
+            [escape_like(lowered) + "%", "%" + escape_like(q) + "%"],
+        )
+
+    pattern = "%" + escape_like(q) + "%"
+    return (
+        f"({alias}.email ILIKE ${n} OR {alias}.username ILIKE ${n} OR {alias}.uid::text ILIKE ${n})",
+        [pattern],
+    )
+
+
+async def typeahead(conn, q: str, limit: int = TYPEAHEAD_LIMIT) -> list:
+    """Короткая выдача для автодополнения в админке."""
+    if len((q or "").strip()) < 2:
+        return []
+    where, args = build_user_filter(q)
+    rows = await conn.fetch(f"""
+        SELECT u.uid, u.email, u.username
+        FROM users u
+        WHERE {where}
+        ORDER BY u.created_at DESC, u.id DESC
+        LIMIT ${len(args) + 1}
+    """, *args, limit)
+    return [{"uid": str(r["uid"]), "email": r["email"], "username": r["username"]} for r in rows]